@@ -0,0 +1,192 @@
+"""Backfill achievements that players qualify for but were never awarded.
+
+Covers rules added after players earned them (new character wins,
+``all_dlc_chars``) and rules the live path couldn't evaluate before.
+Players are streamed in ``player_id`` order in batches. For each batch the
+player stats, a per-character summary of their wins (grouped server-side,
+so heavy players don't pull every session) and existing unlocks are fetched
+with three ``$in`` queries, wins already moved to the Parquet archive are
+summarised the same way for players flagged ``has_archived_sessions``, rules
+are evaluated in a process pool, and missing unlocks
+are written with unordered bulk upserts, plus one ``achievement_unlocked``
+event each (source ``backfill``). Reading the next batch overlaps with
+evaluating and writing the current one.
+
+A checkpoint holds the last fully written ``player_id``, so an interrupted
+run resumes from there. It is replaced atomically, so a crash while saving
+it can't leave a truncated file behind.
+"""
+import asyncio
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+from pymongo import UpdateOne
+
+from checkpoints import load_checkpoint, save_checkpoint
+from progression import SPEED_DEMON_DURATION, SURVIVOR_HEALTH_RATIO, history_achievements
+from session_archive import read_archived_wins
+from store import Store, key_filter, make_event
+
+
+# Numbers compare greater than null and missing fields
+_HEALTH_REPORTED = {"$and": [{"$gt": ["$health_remaining", None]}, {"$gt": ["$max_health", 0]}]}
+
+# The outcome flags of progression.session_result_achievements, any() over each player's wins per character
+WIN_FLAGS = {
+    "speed": {"$max": {"$lt": [{"$ifNull": ["$duration", 0]}, SPEED_DEMON_DURATION]}},
+    "perfect": {"$max": {"$and": [_HEALTH_REPORTED, {"$gte": ["$health_remaining", "$max_health"]}]}},
+    "survivor": {"$max": {"$and": [
+        _HEALTH_REPORTED,
+        {"$gt": ["$health_remaining", 0]},
+        {"$lt": ["$health_remaining", {"$multiply": ["$max_health", SURVIVOR_HEALTH_RATIO]}]},
+    ]}},
+}
+
+WIN_COLUMNS = ["player_id", "character_id", "duration", "health_remaining", "max_health"]
+
+Row = Tuple[Dict, Optional[Dict], List[Dict], List[str]]
+
+
+def evaluate_rows(rows: List[Row]) -> List[Tuple[str, List[str]]]:
+    """Runs in a worker process: (player_id, missing achievement ids) for each player that has any."""
+    missing = []
+    for player, stats, wins, existing in rows:
+        earned = history_achievements(player, stats, wins)
+        new = [ach_id for ach_id in earned if ach_id not in existing]
+        if new:
+            missing.append((player["player_id"], new))
+    return missing
+
+
+def _archived_win_flags(player_ids: List[str]) -> List[Dict]:
+    """WIN_FLAGS computed over archived sessions, in the shape of the ``$group`` output."""
+    if not player_ids:
+        return []
+    df = read_archived_wins(player_ids, WIN_COLUMNS)
+    if df.empty:
+        return []
+    health, max_health = df["health_remaining"], df["max_health"]
+    reported = health.notna() & (max_health > 0)
+    df = df.assign(
+        speed=df["duration"].fillna(0) < SPEED_DEMON_DURATION,
+        perfect=reported & (health >= max_health),
+        survivor=reported & (health > 0) & (health < max_health * SURVIVOR_HEALTH_RATIO),
+    )
+    flags = df.groupby(["player_id", "character_id"], dropna=False)[["speed", "perfect", "survivor"]].any()
+    return [
+        {"_id": {"player_id": player_id, "character_id": None if pd.isna(character_id) else character_id},
+         **{flag: bool(value) for flag, value in row.items()}}
+        for (player_id, character_id), row in flags.iterrows()
+    ]
+
+
+async def _load_rows(db, players: List[Dict]) -> List[Row]:
+    ids = [p["player_id"] for p in players]
+    archived_ids = [p["player_id"] for p in players if p.get("has_archived_sessions")]
+    stats, wins, archived_wins, existing = await asyncio.gather(
+        db.player_stats.find({"player_id": {"$in": ids}}, {"_id": 0}).to_list(None),
+        db.game_sessions.aggregate([
+            {"$match": {"player_id": {"$in": ids}, "victory": True}},
+            {"$group": {"_id": {"player_id": "$player_id", "character_id": "$character_id"}, **WIN_FLAGS}},
+        ]).to_list(None),
+        asyncio.to_thread(_archived_win_flags, archived_ids),
+        db.player_achievements.find({"player_id": {"$in": ids}}, {"_id": 0, "player_id": 1, "achievement_id": 1}).to_list(None),
+    )
+    stats_by_player = {s["player_id"]: s for s in stats}
+    wins_by_player: Dict[str, List[Dict]] = {}
+    # A character with both hot and archived wins gets two entries; history_achievements any()s them
+    for win in wins + archived_wins:
+        key = win.pop("_id")
+        wins_by_player.setdefault(key["player_id"], []).append({"character_id": key.get("character_id"), **win})
+    existing_by_player: Dict[str, List[str]] = {}
+    for pa in existing:
+        existing_by_player.setdefault(pa["player_id"], []).append(pa["achievement_id"])
+    return [
+        (p, stats_by_player.get(p["player_id"]), wins_by_player.get(p["player_id"], []), existing_by_player.get(p["player_id"], []))
+        for p in players
+    ]
+
+
+async def _write_unlocks(db, missing: List[Tuple[str, List[str]]]):
+    unlocked_at = datetime.now(timezone.utc).isoformat()
+    ops, events = [], []
+    for player_id, achievement_ids in missing:
+        for ach_id in achievement_ids:
+            ops.append(UpdateOne(
+                key_filter(player_id, ach_id),
+                {"$setOnInsert": {
+                    "achievement_id": ach_id,
+                    "unlocked_at": unlocked_at,
+                }},
+                upsert=True,
+            ))
+            events.append(make_event("achievement_unlocked", player_id, {"achievement_id": ach_id, "source": "backfill"}))
+    if ops:
+        await db.player_achievements.bulk_write(ops, ordered=False)
+        await Store(db).append_events(events)
+
+
+async def backfill_achievements(
+    db,
+    batch_size: int = 2000,
+    workers: Optional[int] = None,
+    dry_run: bool = False,
+    checkpoint_path: Optional[Path] = None,
+    restart: bool = False,
+    progress=None,
+) -> Dict:
+    """Award every missing rule-based achievement; returns per-achievement unlock counts."""
+    workers = workers or os.cpu_count() or 1
+    state = load_checkpoint(checkpoint_path, restart) if checkpoint_path and not dry_run else {}
+    counts = Counter(state.get("counts", {}))
+    players_seen = state.get("players", 0)
+    loop = asyncio.get_running_loop()
+
+    async def process(players: List[Dict]):
+        nonlocal players_seen
+        rows = await _load_rows(db, players)
+        chunk = -(-len(rows) // workers)
+        results = await asyncio.gather(*[
+            loop.run_in_executor(pool, evaluate_rows, rows[i:i + chunk])
+            for i in range(0, len(rows), chunk)
+        ])
+        missing = [m for result in results for m in result]
+        if not dry_run:
+            await _write_unlocks(db, missing)
+        for _, achievement_ids in missing:
+            counts.update(achievement_ids)
+        players_seen += len(players)
+        if checkpoint_path and not dry_run:
+            save_checkpoint(checkpoint_path, {
+                "last_player_id": players[-1]["player_id"],
+                "players": players_seen,
+                "counts": counts,
+            })
+        if progress:
+            progress(players_seen, counts)
+
+    query = {"player_id": {"$gt": state["last_player_id"]}} if state.get("last_player_id") else {}
+    cursor = db.players.find(query, {"_id": 0, "player_id": 1, "level": 1, "coins": 1, "has_archived_sessions": 1}).sort("player_id", 1).batch_size(batch_size)
+
+    with ProcessPoolExecutor(workers) as pool:
+        in_flight = None
+        batch = []
+        async for player in cursor:
+            batch.append(player)
+            if len(batch) >= batch_size:
+                # Keep at most one batch in flight so checkpoints advance in order
+                if in_flight:
+                    await in_flight
+                in_flight = asyncio.ensure_future(process(batch))
+                batch = []
+        if in_flight:
+            await in_flight
+        if batch:
+            await process(batch)
+
+    return {"players": players_seen, "unlocks": dict(counts)}
@@ -0,0 +1,122 @@
+"""In-process admission control for write-heavy routes.
+
+Each player gets a token bucket (``rate`` requests/second, bursts up to
+``burst``); requests over it are rejected with 429. On top of that a global
+limiter caps how many admitted requests may hit Mongo at once. Up to
+``max_queue`` requests wait for a slot for at most ``queue_timeout`` seconds;
+anything beyond is shed immediately with 503 so the pool never builds an
+unbounded backlog.
+"""
+import asyncio
+import math
+import time
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import HTTPException
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def take(self, rate: float, burst: float) -> float:
+        """Take one token; return 0 on success or the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.updated_at) * rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        rate: float = 5.0,
+        burst: float = 10.0,
+        max_concurrency: int = 50,
+        max_queue: int = 200,
+        queue_timeout: float = 2.0,
+        max_buckets: int = 100000,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_buckets = max_buckets
+        self.counters = Counter()
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._active = 0
+        self._waiting = 0
+
+    def check_rate(self, key: str):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.burst)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+
+        retry_after = bucket.take(self.rate, self.burst)
+        if retry_after:
+            self.counters["rate_limited"] += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    async def _acquire(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self._semaphore.locked():
+            if self._waiting >= self.max_queue:
+                self.counters["shed_queue_full"] += 1
+                raise HTTPException(status_code=503, detail="Server busy", headers={"Retry-After": "1"})
+            self.counters["queued"] += 1
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.counters["shed_queue_timeout"] += 1
+                raise HTTPException(status_code=503, detail="Server busy", headers={"Retry-After": "1"})
+            finally:
+                self._waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self._active += 1
+
+    def _release(self):
+        self._active -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def admit(self, key: Optional[str] = None):
+        """Apply the per-key rate limit (when ``key`` is given) and hold a global slot."""
+        if key is not None:
+            self.check_rate(key)
+        await self._acquire()
+        self.counters["admitted"] += 1
+        try:
+            yield
+        finally:
+            self._release()
+
+    def snapshot(self) -> dict:
+        return {
+            **self.counters,
+            "active": self._active,
+            "waiting": self._waiting,
+            "tracked_players": len(self._buckets),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+        }
@@ -0,0 +1,211 @@
+"""Rotating daily and weekly challenges.
+
+Each UTC day and ISO week gets its own challenges, picked deterministically
+from a pool built over the base characters and the maps (seeded by the
+period key, so every worker agrees without storing definitions). A
+``ChallengeSet`` compiles the active ones once per day into an index keyed by
+``(character_id, map_id)``, so matching a session is a few dict lookups no
+matter how many challenges are active.
+
+Progress lives in one ``player_challenges`` document per player and ISO week::
+
+    {"player_id": ..., "week": "2026-W42",
+     "weekly": {challenge_id: n},
+     "daily": {"2026-10-19": {challenge_id: n}}}
+
+A new day is a new key inside the document and a new week is a new
+document, so rollover needs no writes at all. A completed match costs a
+single ``$inc`` upsert covering every challenge it advanced.
+"""
+import os
+import random
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from progression import CHARACTER_WIN_ACHIEVEMENTS, MAP_ACHIEVEMENTS
+
+
+DAILY_COUNT = int(os.environ.get('CHALLENGES_DAILY_COUNT', 3))
+WEEKLY_COUNT = int(os.environ.get('CHALLENGES_WEEKLY_COUNT', 3))
+
+CHARACTER_NAMES = {
+    "meultra4111": "Meultra4111",
+    "olivo_10": "Olivo_10",
+    "gato": "Gato",
+    "jhon": "Jhon",
+    "riptor": "Riptor",
+    "martin": "Martin",
+    "botsito": "Botsito",
+    "brayan": "Brayan",
+}
+MAP_NAMES = {
+    "roblox": "Roblox World",
+    "minecraft": "Minecraft Biome",
+    "youtube": "YouTube HQ",
+    "discord": "Discord Server",
+}
+
+# Session field summed into a challenge, None counts matches
+METRICS = {
+    "wins": None,
+    "matches": None,
+    "enemies": "enemies_defeated",
+    "score": "score",
+}
+
+# (metric, scope, daily target, weekly target, description)
+TEMPLATES = [
+    ("wins", "character_map", 1, 3, "Gana {target} partida(s) en {map} con {character}"),
+    ("wins", "character", 2, 6, "Gana {target} partidas con {character}"),
+    ("wins", "map", 2, 6, "Gana {target} partidas en {map}"),
+    ("enemies", "character", 20, 100, "Derrota {target} enemigos con {character}"),
+    ("enemies", "map", 20, 100, "Derrota {target} enemigos en {map}"),
+    ("matches", "any", 3, 15, "Juega {target} partidas"),
+    ("score", "any", 1000, 5000, "Consigue {target} puntos"),
+]
+
+REWARDS = {
+    "daily": {"xp": 100, "coins": 150},
+    "weekly": {"xp": 400, "coins": 600},
+}
+
+
+class Challenge:
+    __slots__ = ("challenge_id", "period", "metric", "target", "character_id", "map_id", "description")
+
+    def __init__(self, challenge_id: str, period: str, metric: str, target: int,
+                 character_id: Optional[str], map_id: Optional[str], description: str):
+        self.challenge_id = challenge_id
+        self.period = period
+        self.metric = metric
+        self.target = target
+        self.character_id = character_id
+        self.map_id = map_id
+        self.description = description
+
+    @property
+    def reward(self) -> Dict[str, int]:
+        return REWARDS[self.period]
+
+    def amount(self, session: Dict) -> int:
+        if self.metric == "wins":
+            return 1 if session.get("victory") else 0
+        field = METRICS[self.metric]
+        return session.get(field, 0) if field else 1
+
+    def to_dict(self) -> Dict:
+        return {
+            "challenge_id": self.challenge_id,
+            "period": self.period,
+            "description": self.description,
+            "target": self.target,
+            "reward": self.reward,
+        }
+
+
+def _pool(period: str) -> List[Challenge]:
+    challenges = []
+    for metric, scope, daily_target, weekly_target, description in TEMPLATES:
+        target = daily_target if period == "daily" else weekly_target
+        characters = CHARACTER_WIN_ACHIEVEMENTS if "character" in scope else [None]
+        maps = MAP_ACHIEVEMENTS if "map" in scope else [None]
+        for character_id in characters:
+            for map_id in maps:
+                parts = [metric] + [p for p in (character_id, map_id) if p]
+                challenges.append(Challenge(
+                    "_".join(parts), period, metric, target, character_id, map_id,
+                    description.format(
+                        target=target,
+                        character=CHARACTER_NAMES.get(character_id, ""),
+                        map=MAP_NAMES.get(map_id, ""),
+                    ),
+                ))
+    return challenges
+
+
+@lru_cache(maxsize=16)
+def _pick(period: str, key: str, count: int) -> List[Challenge]:
+    pool = _pool(period)
+    return random.Random(f"{period}:{key}").sample(pool, min(count, len(pool)))
+
+
+def week_key(day: date) -> str:
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+class ChallengeSet:
+    """The daily challenges of ``day`` and the weekly ones of its ISO week."""
+
+    def __init__(self, day: date):
+        self.day = day
+        self.day_key = day.isoformat()
+        self.week_key = week_key(day)
+        self.daily = _pick("daily", self.day_key, DAILY_COUNT)
+        self.weekly = _pick("weekly", self.week_key, WEEKLY_COUNT)
+        self._index: Dict[tuple, List[Challenge]] = {}
+        for challenge in self.daily + self.weekly:
+            self._index.setdefault((challenge.character_id, challenge.map_id), []).append(challenge)
+
+    @property
+    def challenges(self) -> List[Challenge]:
+        return self.daily + self.weekly
+
+    def ends_at(self, period: str) -> str:
+        days = 1 if period == "daily" else 7 - self.day.weekday()
+        return datetime.combine(self.day + timedelta(days=days), time(), timezone.utc).isoformat()
+
+    def field(self, challenge: Challenge) -> str:
+        if challenge.period == "daily":
+            return f"daily.{self.day_key}.{challenge.challenge_id}"
+        return f"weekly.{challenge.challenge_id}"
+
+    def progress_of(self, doc: Optional[Dict], challenge: Challenge) -> int:
+        doc = doc or {}
+        if challenge.period == "daily":
+            return doc.get("daily", {}).get(self.day_key, {}).get(challenge.challenge_id, 0)
+        return doc.get("weekly", {}).get(challenge.challenge_id, 0)
+
+    def increments(self, session: Dict) -> Dict[str, int]:
+        """``$inc`` document advancing every active challenge ``session`` counts towards."""
+        character_id, map_id = session.get("character_id"), session.get("map_id")
+        increments = {}
+        for key in ((character_id, map_id), (character_id, None), (None, map_id), (None, None)):
+            for challenge in self._index.get(key, ()):
+                amount = challenge.amount(session)
+                if amount > 0:
+                    increments[self.field(challenge)] = amount
+        return increments
+
+    def newly_completed(self, doc: Dict, increments: Dict[str, int]) -> List[Challenge]:
+        """Challenges that crossed their target with ``increments``, given the updated document."""
+        completed = []
+        for challenge in self.challenges:
+            amount = increments.get(self.field(challenge))
+            if amount:
+                after = self.progress_of(doc, challenge)
+                if after - amount < challenge.target <= after:
+                    completed.append(challenge)
+        return completed
+
+    def to_dict(self, doc: Optional[Dict] = None) -> Dict:
+        def entries(challenges: List[Challenge]) -> List[Dict]:
+            return [
+                {**c.to_dict(), "progress": min(c.target, self.progress_of(doc, c)),
+                 "completed": self.progress_of(doc, c) >= c.target}
+                for c in challenges
+            ]
+        return {
+            "daily": {"period": self.day_key, "ends_at": self.ends_at("daily"), "challenges": entries(self.daily)},
+            "weekly": {"period": self.week_key, "ends_at": self.ends_at("weekly"), "challenges": entries(self.weekly)},
+        }
+
+
+@lru_cache(maxsize=4)
+def challenge_set(day: date) -> ChallengeSet:
+    return ChallengeSet(day)
+
+
+def current_challenges() -> ChallengeSet:
+    return challenge_set(datetime.now(timezone.utc).date())
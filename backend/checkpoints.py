@@ -0,0 +1,22 @@
+"""JSON checkpoint files for resumable maintenance jobs.
+
+A checkpoint is written to a temporary file and moved into place with
+``os.replace``, so a crash while saving leaves the previous checkpoint
+intact rather than a truncated file.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Dict
+
+
+def load_checkpoint(path: Path, restart: bool = False) -> Dict:
+    if restart or not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def save_checkpoint(path: Path, state: Dict):
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=2))
+    os.replace(tmp, path)
@@ -0,0 +1,427 @@
+"""Maintenance CLI for the Battle Arena database.
+
+    python cli.py export ./backup
+    python cli.py import ./backup --mode upsert
+    python cli.py snapshot-players
+    python cli.py rebuild-projections [--player-id ID] [--dry-run]
+    python cli.py backfill-achievements [--dry-run]
+    python cli.py backfill-purchases [--dry-run]
+    python cli.py migrate-keys [--dry-run]
+    python cli.py shard-collections
+
+For export/import, each collection is streamed to/from ``<dir>/<collection>.ndjson`` in batches,
+so memory use is bounded by ``--batch-size`` regardless of collection size.
+Progress is stored in ``<dir>/checkpoint.json`` after every batch; re-running
+the same command resumes where it stopped (pass ``--restart`` to start over).
+"""
+import asyncio
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import typer
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from achievement_backfill import backfill_achievements
+from events import rebuild_all, rebuild_player, snapshot_players
+from server import client, db, store
+from checkpoints import load_checkpoint, save_checkpoint
+from store import (
+    LEGACY_ID_QUERY,
+    PLAYER_COLLECTIONS,
+    SHARD_KEYS,
+    document_id,
+    event_id,
+    key_filter,
+    raise_unless_duplicate_keys,
+)
+
+
+cli = typer.Typer(help="Team Meultra Battle Arena maintenance commands")
+
+INDEX_NOT_FOUND = 27
+
+# Collection -> fields that identify a document for upserts
+COLLECTIONS: Dict[str, List[str]] = {
+    "players": ["player_id"],
+    "game_sessions": ["session_id"],
+    "player_stats": ["player_id"],
+    "player_inventory": ["player_id", "item_id", "purchased_at"],
+    "player_achievements": ["player_id", "achievement_id"],
+    "player_challenges": ["player_id", "week"],
+    "game_events": ["event_id"],
+}
+
+
+# ==================== COLLECTIONS ====================
+
+def _resolve_collections(names: Optional[List[str]]) -> List[str]:
+    if not names:
+        return list(COLLECTIONS)
+    unknown = [n for n in names if n not in COLLECTIONS]
+    if unknown:
+        raise typer.BadParameter(f"Unknown collection(s): {', '.join(unknown)}")
+    return names
+
+
+# ==================== EXPORT ====================
+
+async def _export_collection(name: str, out_dir: Path, batch_size: int, checkpoint: Dict, checkpoint_path: Path):
+    key = f"export:{name}"
+    state = checkpoint.get(key, {})
+    if state.get("done"):
+        typer.echo(f"{name}: already exported, skipping")
+        return
+
+    query = {}
+    if state.get("last_id"):
+        # ObjectIds sort after every string _id, which were all exported already
+        query = {"_id": {"$gt": ObjectId(state["last_id"])}}
+    elif state.get("last_key"):
+        # $gt only matches strings, so include the not yet migrated ObjectId _ids still to come
+        query = {"$or": [{"_id": {"$gt": state["last_key"]}}, LEGACY_ID_QUERY]}
+    total = await db[name].estimated_document_count()
+    exported = state.get("count", 0)
+
+    with open(out_dir / f"{name}.ndjson", "ab") as f, \
+            typer.progressbar(length=total, label=name) as progress:
+        # Drop anything written after the last checkpoint
+        f.truncate(state.get("offset", 0))
+        progress.update(exported)
+
+        cursor = db[name].find(query).sort("_id", 1).batch_size(batch_size)
+        lines = []
+        last_id = None
+        async for doc in cursor:
+            last_id = doc.pop("_id")
+            # Compound player-prefixed keys are portable, ObjectIds are not
+            if isinstance(last_id, str):
+                doc = {"_id": last_id, **doc}
+            lines.append(json.dumps(doc, default=str, ensure_ascii=False))
+            if len(lines) >= batch_size:
+                exported += len(lines)
+                f.write(("\n".join(lines) + "\n").encode())
+                f.flush()
+                last = {"last_id": str(last_id)} if isinstance(last_id, ObjectId) else {"last_key": last_id}
+                checkpoint[key] = {**last, "offset": f.tell(), "count": exported}
+                save_checkpoint(checkpoint_path, checkpoint)
+                progress.update(len(lines))
+                lines = []
+
+        if lines:
+            exported += len(lines)
+            f.write(("\n".join(lines) + "\n").encode())
+            progress.update(len(lines))
+
+    checkpoint[key] = {"done": True, "count": exported}
+    save_checkpoint(checkpoint_path, checkpoint)
+    typer.echo(f"{name}: exported {exported} documents")
+
+
+@cli.command()
+def export(
+    out_dir: Path = typer.Argument(..., help="Directory to write <collection>.ndjson files to"),
+    collections: Optional[List[str]] = typer.Option(None, "--collection", "-c", help="Collection to export (repeatable, default: all)"),
+    batch_size: int = typer.Option(5000, help="Documents per cursor batch and checkpoint"),
+    restart: bool = typer.Option(False, help="Ignore existing checkpoints"),
+):
+    """Stream collections to NDJSON files."""
+    names = _resolve_collections(collections)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint_path = out_dir / "checkpoint.json"
+    checkpoint = load_checkpoint(checkpoint_path, restart)
+
+    async def run():
+        for name in names:
+            await _export_collection(name, out_dir, batch_size, checkpoint, checkpoint_path)
+
+    asyncio.run(run())
+    client.close()
+
+
+# ==================== IMPORT ====================
+
+def _upsert_filter(name: str, doc: dict) -> dict:
+    if "_id" not in doc:
+        return {k: doc.get(k) for k in COLLECTIONS[name]}
+    # Sharded collections need the whole shard key to route an upsert
+    if name in SHARD_KEYS:
+        return {"player_id": doc["player_id"], "_id": doc["_id"]}
+    return {"_id": doc["_id"]}
+
+
+async def _write_batch(name: str, docs: List[dict], mode: str):
+    for doc in docs:
+        if "_id" not in doc and document_id(name, doc):
+            doc["_id"] = document_id(name, doc)
+    if mode == "insert":
+        try:
+            await db[name].insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Re-running a partially imported batch is fine; anything else is not
+            raise_unless_duplicate_keys(e)
+    else:
+        await db[name].bulk_write([ReplaceOne(_upsert_filter(name, doc), doc, upsert=True) for doc in docs], ordered=False)
+
+
+async def _import_collection(name: str, in_dir: Path, batch_size: int, mode: str, checkpoint: Dict, checkpoint_path: Path):
+    key = f"import:{name}"
+    state = checkpoint.get(key, {})
+    path = in_dir / f"{name}.ndjson"
+    if state.get("done"):
+        typer.echo(f"{name}: already imported, skipping")
+        return
+    if not path.exists():
+        typer.echo(f"{name}: {path} not found, skipping")
+        return
+
+    offset = state.get("offset", 0)
+    imported = state.get("count", 0)
+
+    with open(path, "rb") as f, \
+            typer.progressbar(length=path.stat().st_size, label=name) as progress:
+        f.seek(offset)
+        progress.update(offset)
+        docs = []
+        batch_bytes = 0
+        for line in f:
+            batch_bytes += len(line)
+            if line.strip():
+                docs.append(json.loads(line))
+            if len(docs) >= batch_size:
+                await _write_batch(name, docs, mode)
+                offset += batch_bytes
+                imported += len(docs)
+                checkpoint[key] = {"offset": offset, "count": imported}
+                save_checkpoint(checkpoint_path, checkpoint)
+                progress.update(batch_bytes)
+                docs = []
+                batch_bytes = 0
+
+        if docs:
+            await _write_batch(name, docs, mode)
+            imported += len(docs)
+        progress.update(batch_bytes)
+
+    checkpoint[key] = {"done": True, "count": imported}
+    save_checkpoint(checkpoint_path, checkpoint)
+    typer.echo(f"{name}: imported {imported} documents")
+
+
+@cli.command("import")
+def import_(
+    in_dir: Path = typer.Argument(..., exists=True, file_okay=False, help="Directory containing <collection>.ndjson files"),
+    collections: Optional[List[str]] = typer.Option(None, "--collection", "-c", help="Collection to import (repeatable, default: all)"),
+    batch_size: int = typer.Option(5000, help="Documents per bulk write and checkpoint"),
+    mode: str = typer.Option("upsert", help="'upsert' replaces documents by natural key, 'insert' appends"),
+    restart: bool = typer.Option(False, help="Ignore existing checkpoints"),
+):
+    """Stream NDJSON files into collections with unordered bulk writes."""
+    if mode not in ("upsert", "insert"):
+        raise typer.BadParameter("mode must be 'upsert' or 'insert'")
+    names = _resolve_collections(collections)
+    checkpoint_path = in_dir / "checkpoint.json"
+    checkpoint = load_checkpoint(checkpoint_path, restart)
+
+    async def run():
+        if mode == "upsert":
+            await store.create_indexes()
+        for name in names:
+            await _import_collection(name, in_dir, batch_size, mode, checkpoint, checkpoint_path)
+
+    asyncio.run(run())
+    client.close()
+
+
+# ==================== EVENT PROJECTIONS ====================
+
+@cli.command("snapshot-players")
+def snapshot_players_(
+    batch_size: int = typer.Option(1000, help="Players per batch"),
+):
+    """Record a baseline snapshot event for players created before the event log."""
+    written = asyncio.run(snapshot_players(db, batch_size))
+    client.close()
+    typer.echo(f"Wrote {written} player snapshots")
+
+
+@cli.command("rebuild-projections")
+def rebuild_projections(
+    player_id: Optional[str] = typer.Option(None, help="Rebuild a single player (default: all players)"),
+    batch_size: int = typer.Option(1000, help="Players per bulk write"),
+    concurrency: int = typer.Option(4, help="Bulk write batches in flight"),
+    dry_run: bool = typer.Option(False, help="Replay events without writing projections"),
+):
+    """Rebuild stats, levels, coins and achievements from the game event log."""
+    if player_id:
+        try:
+            projection = asyncio.run(rebuild_player(db, player_id, dry_run))
+        except RuntimeError as e:
+            typer.echo(str(e), err=True)
+            raise typer.Exit(1)
+        finally:
+            client.close()
+        if projection is None:
+            typer.echo(f"{player_id}: no player_created/player_snapshot event, nothing rebuilt")
+            raise typer.Exit(1)
+        typer.echo(json.dumps({**projection.player, "total_xp": projection.total_xp,
+                               "achievements": sorted(projection.achievements)}, indent=2))
+        return
+
+    def report(counts):
+        typer.echo(f"events={counts['events']} rebuilt={counts['rebuilt']} skipped={counts['skipped']}")
+
+    try:
+        asyncio.run(rebuild_all(db, batch_size, concurrency, dry_run, progress=report))
+    except RuntimeError as e:
+        typer.echo(str(e), err=True)
+        raise typer.Exit(1)
+    finally:
+        client.close()
+
+
+# ==================== ACHIEVEMENT BACKFILL ====================
+
+@cli.command("backfill-achievements")
+def backfill_achievements_(
+    batch_size: int = typer.Option(2000, help="Players per batch"),
+    workers: Optional[int] = typer.Option(None, help="Rule evaluation processes (default: CPU count)"),
+    dry_run: bool = typer.Option(False, help="Report missing unlocks without writing them"),
+    checkpoint: Path = typer.Option(Path("backfill_checkpoint.json"), help="Checkpoint file for resuming"),
+    restart: bool = typer.Option(False, help="Ignore an existing checkpoint"),
+):
+    """Award achievements players qualify for but never received."""
+    def report(players, counts):
+        typer.echo(f"players={players} unlocks={sum(counts.values())}")
+
+    result = asyncio.run(backfill_achievements(db, batch_size, workers, dry_run, checkpoint, restart, progress=report))
+    client.close()
+    typer.echo(json.dumps(result, indent=2))
+
+
+# ==================== PURCHASE COUNTS ====================
+
+async def _backfill_purchases(batch_size: int, dry_run: bool) -> int:
+    players = 0
+    ops = []
+    cursor = db.player_inventory.aggregate(
+        [{"$group": {"_id": "$player_id", "count": {"$sum": 1}}}],
+        allowDiskUse=True,
+    )
+    async for row in cursor:
+        players += 1
+        ops.append(UpdateOne(key_filter(row["_id"]), {"$set": {"total_purchases": row["count"]}}, upsert=True))
+        if len(ops) >= batch_size:
+            if not dry_run:
+                await db.player_stats.bulk_write(ops, ordered=False)
+            ops = []
+    if ops and not dry_run:
+        await db.player_stats.bulk_write(ops, ordered=False)
+    return players
+
+
+@cli.command("backfill-purchases")
+def backfill_purchases(
+    batch_size: int = typer.Option(1000, help="Stats documents per bulk write"),
+    dry_run: bool = typer.Option(False, help="Only count players with purchases"),
+):
+    """Set player_stats.total_purchases from each player's inventory.
+
+    The counter only started being kept with the purchase achievements, so
+    players who haven't bought anything since show no purchase progress.
+    (``snapshot-players`` fills the counter the same way in the snapshots it
+    writes.)
+    """
+    players = asyncio.run(_backfill_purchases(batch_size, dry_run))
+    client.close()
+    typer.echo(f"{players} players {'to update' if dry_run else 'updated'}")
+
+
+# ==================== COMPOUND KEYS ====================
+
+async def _migrate_collection(name: str, batch_size: int, dry_run: bool) -> int:
+    query = LEGACY_ID_QUERY
+    if dry_run:
+        return await db[name].count_documents(query)
+
+    migrated = 0
+    while True:
+        # Migrated documents leave the query, so each pass starts from the front again
+        batch = await db[name].find(query).sort("_id", 1).to_list(batch_size)
+        if not batch:
+            break
+        old_ids = []
+        docs = []
+        for doc in batch:
+            old_id = doc.pop("_id")
+            old_ids.append(old_id)
+            new_id = event_id(doc["player_id"], old_id) if name == "game_events" else document_id(name, doc)
+            docs.append({"_id": new_id, **doc})
+        try:
+            await db[name].insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Already copied by an interrupted run, or a legacy duplicate of the same natural key
+            raise_unless_duplicate_keys(e)
+        await db[name].delete_many({"_id": {"$in": old_ids}})
+        migrated += len(batch)
+        typer.echo(f"{name}: {migrated} migrated")
+    return migrated
+
+
+@cli.command("migrate-keys")
+def migrate_keys(
+    collections: Optional[List[str]] = typer.Option(None, "--collection", "-c", help="Collection to migrate (repeatable, default: all per-player collections)"),
+    batch_size: int = typer.Option(1000, help="Documents per batch"),
+    dry_run: bool = typer.Option(False, help="Only count documents still on ObjectId keys"),
+):
+    """Rewrite ObjectId _ids to player-prefixed compound keys.
+
+    Required before deploying the compound-key store: its updates and upserts
+    match on ``_id`` and would miss (and duplicate) unmigrated documents.
+    Run it with the API stopped: a document updated between being copied and
+    deleted would lose that update. The command is idempotent, so an
+    interrupted run can simply be started again.
+    """
+    names = collections or list(PLAYER_COLLECTIONS)
+    unknown = [n for n in names if n not in PLAYER_COLLECTIONS]
+    if unknown:
+        raise typer.BadParameter(f"Unknown collection(s): {', '.join(unknown)}")
+
+    async def run():
+        for name in names:
+            count = await _migrate_collection(name, batch_size, dry_run)
+            typer.echo(f"{name}: {count} documents {'to migrate' if dry_run else 'migrated'}")
+
+    asyncio.run(run())
+    client.close()
+
+
+@cli.command("shard-collections")
+def shard_collections():
+    """Shard every per-player collection on {player_id, _id} (run against mongos).
+
+    Run ``migrate-keys`` first: the API addresses documents by their compound
+    ``_id`` from then on.
+    """
+    async def run():
+        # Uniqueness of weekly challenge documents now comes from _id, and a
+        # unique index not prefixed by the shard key would block sharding
+        try:
+            await db.player_challenges.drop_index("player_id_1_week_1")
+        except OperationFailure as e:
+            if e.code != INDEX_NOT_FOUND:
+                raise
+        await store.create_indexes()
+        await client.admin.command("enableSharding", db.name)
+        for name, key in SHARD_KEYS.items():
+            await client.admin.command("shardCollection", f"{db.name}.{name}", key=key)
+            typer.echo(f"{name}: sharded on {key}")
+
+    asyncio.run(run())
+    client.close()
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,254 @@
+"""Append-only game event log and the projections rebuilt from it.
+
+Every route that changes player progress also appends an event to
+``game_events`` (``Store.append_event``). ``PlayerProjection`` folds a player's events, in ``_id``
+order, back into the ``players`` progress fields, ``player_stats`` and
+``player_achievements``, re-evaluating the rules in ``progression`` as it
+goes. A rule change or a bug can therefore be repaired by rebuilding the
+projections instead of writing a one-off repair script. A rebuild replaces
+the stats document and removes achievements the log no longer grants.
+
+Players that existed before the log did are covered by a
+``player_snapshot`` event (see ``snapshot_players``). A player whose log has
+neither a ``player_created`` nor a ``player_snapshot`` event is skipped by
+the rebuild, since their early history is missing.
+
+Event ``_id``s sort in insertion order only once every event has a compound
+key: legacy ObjectId ``_id``s sort after all strings. Rebuilds therefore
+refuse to run until ``cli.py migrate-keys`` has converted the log.
+"""
+import asyncio
+from typing import Dict, List, Optional
+
+from pymongo import DeleteMany, ReplaceOne, UpdateOne
+
+from progression import (
+    DLC_UNLOCK_LEVEL,
+    STARTING_COINS,
+    apply_session,
+    empty_stats,
+    level_progress,
+    purchase_achievements,
+    session_achievements,
+    total_xp_of,
+)
+from store import LEGACY_ID_QUERY, Store, key_filter, make_event, player_key
+
+
+# ==================== PROJECTION ====================
+
+class PlayerProjection:
+    def __init__(self, player_id: str):
+        self.player_id = player_id
+        self.has_baseline = False
+        self.total_xp = 0
+        self.coins = STARTING_COINS
+        self.stats = empty_stats(player_id)
+        self.achievements: Dict[str, str] = {}
+
+    @property
+    def player(self) -> Dict:
+        return {"level": level_progress(self.total_xp)["level"], "coins": self.coins}
+
+    def apply(self, event: Dict):
+        handler = getattr(self, f"_on_{event['type']}", None)
+        if handler is not None:
+            handler(event.get("data", {}), event["created_at"])
+
+    def _unlock(self, achievement_ids: List[str], at: str):
+        for ach_id in achievement_ids:
+            self.achievements.setdefault(ach_id, at)
+
+    def _on_player_created(self, data: Dict, at: str):
+        self.has_baseline = True
+        self.coins = data.get("coins", STARTING_COINS)
+
+    def _on_player_snapshot(self, data: Dict, at: str):
+        # A snapshot captures the full state at that point, including any earlier events
+        self.has_baseline = True
+        self.total_xp = data.get("total_xp", 0)
+        self.coins = data.get("coins", STARTING_COINS)
+        self.stats = {**empty_stats(self.player_id), **data.get("stats", {}), "player_id": self.player_id}
+        self.achievements = dict(data.get("achievements", {}))
+
+    def _on_xp_granted(self, data: Dict, at: str):
+        self.total_xp = max(0, self.total_xp + data["xp"])
+
+    def _on_coins_changed(self, data: Dict, at: str):
+        self.coins += data["amount"]
+
+    def _on_session_completed(self, data: Dict, at: str):
+        apply_session(
+            self.stats, data["character_id"], data["map_id"], data["score"], data["enemies_defeated"],
+            data["victory"], data.get("bullets_shot", 0), data.get("special_used", 0),
+        )
+        self._unlock(
+            session_achievements(self.stats, self.player, data),
+            at,
+        )
+
+    def _on_item_purchased(self, data: Dict, at: str):
+        self.stats["total_coins_spent"] = self.stats.get("total_coins_spent", 0) + data["price"]
+        self.stats["total_purchases"] = self.stats.get("total_purchases", 0) + 1
+        self._unlock(purchase_achievements(self.stats, self.player, data["item_type"]), at)
+
+    def _on_achievement_unlocked(self, data: Dict, at: str):
+        # Live rule unlocks are re-derived above; manual and backfilled ones are replayed as-is
+        if data.get("source") != "rules":
+            self._unlock([data["achievement_id"]], at)
+
+    def write_ops(self) -> Dict[str, list]:
+        progress = level_progress(self.total_xp)
+        return {
+            "players": [UpdateOne(key_filter(self.player_id), {"$set": {
+                "level": progress["level"],
+                "xp": progress["xp"],
+                "total_xp": progress["total_xp"],
+                "coins": self.coins,
+                "unlocked_dlc": progress["level"] >= DLC_UNLOCK_LEVEL,
+            }})],
+            # Replaced outright so counters the rules no longer derive don't linger
+            "player_stats": [ReplaceOne(
+                key_filter(self.player_id),
+                {"_id": player_key(self.player_id), **self.stats},
+                upsert=True,
+            )],
+            "player_achievements": [
+                DeleteMany({"player_id": self.player_id, "achievement_id": {"$nin": list(self.achievements)}}),
+            ] + [
+                UpdateOne(
+                    key_filter(self.player_id, ach_id),
+                    {"$setOnInsert": {
+                        "achievement_id": ach_id,
+                        "unlocked_at": at,
+                    }},
+                    upsert=True,
+                )
+                for ach_id, at in self.achievements.items()
+            ],
+        }
+
+
+async def _write_projections(db, projections: List[PlayerProjection]):
+    ops = {"players": [], "player_stats": [], "player_achievements": []}
+    for projection in projections:
+        for collection, collection_ops in projection.write_ops().items():
+            ops[collection] += collection_ops
+    await asyncio.gather(*[
+        db[collection].bulk_write(collection_ops, ordered=False)
+        for collection, collection_ops in ops.items() if collection_ops
+    ])
+
+
+async def _require_compound_ids(db, query: Dict):
+    if await db.game_events.find_one({**query, **LEGACY_ID_QUERY}, {"_id": 1}):
+        raise RuntimeError("game_events still has ObjectId _ids, so _id order isn't event order; run cli.py migrate-keys first")
+
+
+async def rebuild_player(db, player_id: str, dry_run: bool = False) -> Optional[PlayerProjection]:
+    """Rebuild one player's projections; returns None if their log has no baseline."""
+    await _require_compound_ids(db, {"player_id": player_id})
+    projection = PlayerProjection(player_id)
+    async for event in db.game_events.find({"player_id": player_id}, {"_id": 0}).sort("_id", 1):
+        projection.apply(event)
+    if not projection.has_baseline:
+        return None
+    if not dry_run:
+        await _write_projections(db, [projection])
+    return projection
+
+
+async def rebuild_all(db, batch_size: int = 1000, concurrency: int = 4, dry_run: bool = False, progress=None) -> Dict[str, int]:
+    """Stream the whole log in (player_id, _id) order and rebuild every player.
+
+    Projections are written in bulk batches of ``batch_size`` players, with up
+    to ``concurrency`` batches in flight while the log keeps streaming.
+    """
+    await _require_compound_ids(db, {})
+    counts = {"events": 0, "rebuilt": 0, "skipped": 0}
+    in_flight = set()
+    pending: List[PlayerProjection] = []
+
+    async def submit(batch: List[PlayerProjection]):
+        nonlocal in_flight
+        while len(in_flight) >= concurrency:
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        in_flight.add(asyncio.ensure_future(_write_projections(db, batch)))
+
+    async def finish(projection: PlayerProjection):
+        nonlocal pending
+        if not projection.has_baseline:
+            counts["skipped"] += 1
+            return
+        counts["rebuilt"] += 1
+        pending.append(projection)
+        if len(pending) >= batch_size:
+            if not dry_run:
+                await submit(pending)
+            pending = []
+            if progress:
+                progress(counts)
+
+    current: Optional[PlayerProjection] = None
+    cursor = db.game_events.find({}, {"_id": 0}).sort([("player_id", 1), ("_id", 1)]).batch_size(batch_size * 10)
+    async for event in cursor:
+        counts["events"] += 1
+        if current is None or event["player_id"] != current.player_id:
+            if current is not None:
+                await finish(current)
+            current = PlayerProjection(event["player_id"])
+        current.apply(event)
+
+    if current is not None:
+        await finish(current)
+    if pending and not dry_run:
+        await submit(pending)
+    await asyncio.gather(*in_flight)
+    if progress:
+        progress(counts)
+    return counts
+
+
+async def snapshot_players(db, batch_size: int = 1000) -> int:
+    """Write a player_snapshot event for every player whose log has no baseline yet."""
+    written = 0
+    batch = []
+
+    async def snapshot(players: List[Dict]) -> int:
+        ids = [p["player_id"] for p in players]
+        covered = set(await db.game_events.distinct(
+            "player_id", {"player_id": {"$in": ids}, "type": {"$in": ["player_created", "player_snapshot"]}}
+        ))
+        ids = [pid for pid in ids if pid not in covered]
+        if not ids:
+            return 0
+        stats = {s["player_id"]: s async for s in db.player_stats.find({"player_id": {"$in": ids}}, {"_id": 0})}
+        # Stats written before purchases were counted lack total_purchases
+        purchases = await Store(db).count_inventory_by_player(ids)
+        for pid in ids:
+            stats.setdefault(pid, {}).setdefault("total_purchases", purchases.get(pid, 0))
+        achievements: Dict[str, Dict[str, str]] = {}
+        async for pa in db.player_achievements.find({"player_id": {"$in": ids}}, {"_id": 0}):
+            achievements.setdefault(pa["player_id"], {})[pa["achievement_id"]] = pa.get("unlocked_at")
+        events = [
+            make_event("player_snapshot", p["player_id"], {
+                "total_xp": total_xp_of(p),
+                "coins": p.get("coins", STARTING_COINS),
+                "stats": stats[p["player_id"]],
+                "achievements": achievements.get(p["player_id"], {}),
+            })
+            for p in players if p["player_id"] in ids
+        ]
+        await Store(db).append_events(events)
+        return len(events)
+
+    async for player in db.players.find({}, {"_id": 0}).batch_size(batch_size):
+        batch.append(player)
+        if len(batch) >= batch_size:
+            written += await snapshot(batch)
+            batch = []
+    if batch:
+        written += await snapshot(batch)
+    return written
@@ -0,0 +1,259 @@
+"""In-process matchmaking queue.
+
+Queued players live in per-(map, level bucket) lists kept sorted by
+``(level, seq)``, so the closest-level opponent is found with a bisect in
+the player's own bucket and the neighbouring buckets covered by the search
+window. The window starts at ``base_window`` levels and widens by
+``widen_per_second`` for every second a player has waited, up to
+``max_window``.
+
+A background loop runs ``tick`` every ``tick_interval`` seconds. Each tick
+takes at most ``max_scans`` tickets from the front of the queue and moves
+the ones still waiting to the back, so the work per tick stays bounded
+however long the queue is and every ticket gets scanned in turn. Matched
+pairs are passed to ``create_match``, which creates their game sessions.
+
+Clients keep their ticket alive by polling its status; a queued ticket not
+polled for ``queue_ttl`` seconds is dropped, either when its own turn in
+the scan comes or when it turns up as someone else's candidate, so players
+who closed the page are never matched.
+"""
+import asyncio
+import itertools
+import logging
+import time
+import uuid
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Ticket:
+    __slots__ = ("player_id", "character_id", "map_id", "level", "seq", "enqueued_at", "last_seen", "status", "match")
+
+    def __init__(self, player_id: str, character_id: str, map_id: str, level: int, seq: int):
+        self.player_id = player_id
+        self.character_id = character_id
+        self.map_id = map_id
+        self.level = level
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.last_seen = self.enqueued_at
+        self.status = "queued"
+        self.match: Optional[Dict] = None
+
+    @property
+    def key(self) -> Tuple[int, int, str]:
+        return (self.level, self.seq, self.player_id)
+
+    def to_dict(self) -> Dict:
+        return {
+            "player_id": self.player_id,
+            "character_id": self.character_id,
+            "map_id": self.map_id,
+            "level": self.level,
+            "status": self.status,
+            "waited": round(time.monotonic() - self.enqueued_at, 1),
+            "match": self.match,
+        }
+
+
+class Matchmaker:
+    def __init__(
+        self,
+        create_match: Callable[[Ticket, Ticket, str], Awaitable[Dict]],
+        bucket_size: int = 5,
+        base_window: int = 2,
+        widen_per_second: float = 1.0,
+        max_window: int = 30,
+        tick_interval: float = 0.5,
+        max_scans: int = 2000,
+        result_ttl: float = 60.0,
+        queue_ttl: float = 30.0,
+    ):
+        self.create_match = create_match
+        self.bucket_size = bucket_size
+        self.base_window = base_window
+        self.widen_per_second = widen_per_second
+        self.max_window = max_window
+        self.tick_interval = tick_interval
+        self.max_scans = max_scans
+        self.result_ttl = result_ttl
+        self.queue_ttl = queue_ttl
+        self._seq = itertools.count()
+        self._tickets: Dict[str, Ticket] = {}
+        self._buckets: Dict[Tuple[str, int], List[Tuple[int, int, str]]] = {}
+        self._order: Deque[Ticket] = deque()
+        self._matched: Deque[Tuple[float, Ticket]] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self.matches_made = 0
+        self.expired = 0
+
+    # ---------- queue operations ----------
+
+    def _bucket(self, map_id: str, level: int) -> List[Tuple[int, int, str]]:
+        return self._buckets.setdefault((map_id, level // self.bucket_size), [])
+
+    def _remove_from_bucket(self, ticket: Ticket):
+        bucket = self._bucket(ticket.map_id, ticket.level)
+        i = bisect_left(bucket, ticket.key)
+        if i < len(bucket) and bucket[i] == ticket.key:
+            del bucket[i]
+
+    def enqueue(self, player_id: str, character_id: str, map_id: str, level: int) -> Ticket:
+        existing = self._tickets.get(player_id)
+        # A ticket being matched may still become a match, so it is not replaced either
+        if existing and existing.status in ("queued", "matching"):
+            return existing
+        ticket = Ticket(player_id, character_id, map_id, level, next(self._seq))
+        self._tickets[player_id] = ticket
+        insort(self._bucket(map_id, level), ticket.key)
+        self._order.append(ticket)
+        return ticket
+
+    def cancel(self, player_id: str) -> bool:
+        ticket = self._tickets.get(player_id)
+        if not ticket or ticket.status != "queued":
+            return False
+        ticket.status = "cancelled"
+        self._remove_from_bucket(ticket)
+        del self._tickets[player_id]
+        return True
+
+    def status(self, player_id: str) -> Optional[Ticket]:
+        """Look up a player's ticket; polling it keeps a queued ticket alive."""
+        ticket = self._tickets.get(player_id)
+        if ticket is not None:
+            ticket.last_seen = time.monotonic()
+        return ticket
+
+    def _is_stale(self, ticket: Ticket, now: float) -> bool:
+        return now - ticket.last_seen > self.queue_ttl
+
+    def _expire(self, ticket: Ticket):
+        ticket.status = "expired"
+        self._remove_from_bucket(ticket)
+        if self._tickets.get(ticket.player_id) is ticket:
+            del self._tickets[ticket.player_id]
+        self.expired += 1
+
+    # ---------- pairing ----------
+
+    def window(self, ticket: Ticket, now: float) -> int:
+        waited = now - ticket.enqueued_at
+        return min(self.max_window, int(self.base_window + waited * self.widen_per_second))
+
+    def find_opponent(self, ticket: Ticket, now: float) -> Optional[Ticket]:
+        window = self.window(ticket, now)
+        best = None
+        low, high = max(0, ticket.level - window) // self.bucket_size, (ticket.level + window) // self.bucket_size
+        for bucket_index in range(low, high + 1):
+            bucket = self._buckets.get((ticket.map_id, bucket_index))
+            if not bucket:
+                continue
+            while True:
+                i = bisect_left(bucket, (ticket.level,))
+                candidates = []
+                if i > 0:
+                    candidates.append(bucket[i - 1])
+                for key in bucket[i:i + 2]:
+                    if key[2] != ticket.player_id:
+                        candidates.append(key)
+                        break
+                # A candidate may have stopped polling since its own last scan
+                stale = [self._tickets[key[2]] for key in candidates if self._is_stale(self._tickets[key[2]], now)]
+                if not stale:
+                    break
+                for candidate in stale:
+                    self._expire(candidate)
+            for key in candidates:
+                distance = abs(key[0] - ticket.level)
+                if distance <= window and (best is None or (distance, key[1]) < best[0]):
+                    best = ((distance, key[1]), key)
+        return self._tickets[best[1][2]] if best else None
+
+    async def tick(self):
+        now = time.monotonic()
+        pairs = []
+
+        # Every ticket sits in _order once until it leaves the queue; the scanned
+        # ones go back to the end so the next tick starts with those not seen yet
+        for _ in range(min(self.max_scans, len(self._order))):
+            ticket = self._order.popleft()
+            if ticket.status == "queued":
+                if self._is_stale(ticket, now):
+                    self._expire(ticket)
+                    continue
+                opponent = self.find_opponent(ticket, now)
+                if opponent is not None:
+                    for t in (ticket, opponent):
+                        t.status = "matching"
+                        self._remove_from_bucket(t)
+                    pairs.append((ticket, opponent))
+            if ticket.status in ("queued", "matching"):
+                self._order.append(ticket)
+
+        if pairs:
+            await asyncio.gather(*[self._start_match(a, b) for a, b in pairs])
+
+        while self._matched and self._matched[0][0] < now:
+            _, ticket = self._matched.popleft()
+            if self._tickets.get(ticket.player_id) is ticket:
+                del self._tickets[ticket.player_id]
+
+    async def _start_match(self, a: Ticket, b: Ticket):
+        match_id = str(uuid.uuid4())
+        try:
+            sessions = await self.create_match(a, b, match_id)
+        except Exception:
+            logger.exception("Failed to create match for %s and %s", a.player_id, b.player_id)
+            for t in (a, b):
+                if self._tickets.get(t.player_id) is t:
+                    t.status = "queued"
+                    insort(self._bucket(t.map_id, t.level), t.key)
+                else:
+                    t.status = "cancelled"
+            return
+        expires_at = time.monotonic() + self.result_ttl
+        for t, opponent in ((a, b), (b, a)):
+            t.status = "matched"
+            t.match = {
+                "match_id": match_id,
+                "session_id": sessions[t.player_id],
+                "opponent_id": opponent.player_id,
+                "opponent_level": opponent.level,
+            }
+            self._matched.append((expires_at, t))
+        self.matches_made += 1
+
+    # ---------- background loop ----------
+
+    async def _run(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception:
+                logger.exception("Matchmaking tick failed")
+            await asyncio.sleep(self.tick_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> Dict:
+        return {
+            "queued": sum(len(b) for b in self._buckets.values()),
+            "matches_made": self.matches_made,
+            "expired": self.expired,
+        }
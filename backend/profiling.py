@@ -0,0 +1,182 @@
+"""On-demand CPU and allocation profiling for live workers.
+
+An admin starts a profiling session for some routes (by endpoint name, e.g.
+``update_game_session``) or all of them, a sample rate and a duration.
+While the session runs, ``ProfilingMiddleware`` samples matching requests:
+
+* CPU: one ``cProfile.Profile`` is shared by the whole session and is enabled
+  while at least one sampled request is in flight, so the result aggregates
+  every sampled request. Routes here are async and run on the event-loop
+  thread, which is the thread cProfile sees. Work interleaved with a sampled
+  request at its await points is captured too, so keep the sample rate low
+  on busy workers.
+* Allocations (optional): ``tracemalloc`` runs for the whole session. If it
+  was already tracing (e.g. ``PYTHONTRACEMALLOC``) it is left running.
+
+When the session is stopped or its duration expires (a timer on the event
+loop, so idle workers stop on time too), the profile is written
+to ``PROFILE_DIR`` as ``.pstats`` (readable with ``pstats``/snakeviz) and the
+allocation snapshot as ``.tracemalloc`` (``tracemalloc.Snapshot.load``).
+
+With no session running, the middleware costs one attribute check per request.
+"""
+import asyncio
+import cProfile
+import logging
+import os
+import random
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from starlette.routing import Match
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent
+
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', ROOT_DIR / 'profiles'))
+TRACEMALLOC_FRAMES = int(os.environ.get('PROFILE_TRACEMALLOC_FRAMES', 10))
+
+
+class ProfilingSession:
+    def __init__(self, routes: Optional[List[str]], sample_rate: float, duration: float, allocations: bool):
+        self.routes = set(routes) if routes else None
+        self.sample_rate = sample_rate
+        self.allocations = allocations
+        self.started_at = datetime.now(timezone.utc)
+        self.ends_at = time.monotonic() + duration
+        self.profile = cProfile.Profile()
+        self.started_tracemalloc = False
+        self.in_flight = 0
+        self.sampled = 0
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.ends_at
+
+    def wants(self, scope) -> bool:
+        if random.random() >= self.sample_rate:
+            return False
+        return self.routes is None or _route_name(scope) in self.routes
+
+    def enter(self) -> bool:
+        if self.in_flight == 0:
+            try:
+                self.profile.enable()
+            except ValueError:
+                # Another profiler (e.g. a debugger) owns the thread
+                return False
+        self.in_flight += 1
+        self.sampled += 1
+        return True
+
+    def exit(self):
+        self.in_flight -= 1
+        if self.in_flight == 0:
+            self.profile.disable()
+
+    def to_dict(self) -> Dict:
+        return {
+            "routes": sorted(self.routes) if self.routes else None,
+            "sample_rate": self.sample_rate,
+            "allocations": self.allocations,
+            "started_at": self.started_at.isoformat(),
+            "remaining": max(0.0, round(self.ends_at - time.monotonic(), 1)),
+            "sampled": self.sampled,
+        }
+
+
+class Profiler:
+    def __init__(self, out_dir: Path = PROFILE_DIR):
+        self.out_dir = out_dir
+        self.session: Optional[ProfilingSession] = None
+        self._stopping: Optional[asyncio.Task] = None
+        self._expiry: Optional[asyncio.TimerHandle] = None
+
+    def start(self, routes: Optional[List[str]], sample_rate: float, duration: float, allocations: bool) -> Dict:
+        if self.session is not None:
+            raise RuntimeError("A profiling session is already running")
+        self.session = ProfilingSession(routes, sample_rate, duration, allocations)
+        if allocations and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.session.started_tracemalloc = True
+        self._expiry = asyncio.get_running_loop().call_later(duration, self.expire)
+        return self.session.to_dict()
+
+    def status(self) -> Dict:
+        return {"running": self.session is not None, "session": self.session.to_dict() if self.session else None}
+
+    def _write(self, session: ProfilingSession, snapshot: Optional[tracemalloc.Snapshot]) -> Dict:
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        label = "-".join(sorted(session.routes)) if session.routes else "all"
+        stem = f"{session.started_at:%Y%m%dT%H%M%S}-{label}"
+        files = {}
+        if session.sampled:
+            files["cpu"] = str(self.out_dir / f"{stem}.pstats")
+            session.profile.dump_stats(files["cpu"])
+        if snapshot is not None:
+            files["allocations"] = str(self.out_dir / f"{stem}.tracemalloc")
+            snapshot.dump(files["allocations"])
+        return files
+
+    async def stop(self) -> Dict:
+        """End the session and write its profiles; returns the session summary and file paths."""
+        session = self.session
+        if session is None:
+            return {"running": False, "files": {}}
+        self.session = None
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+        if session.in_flight:
+            session.in_flight = 0
+            session.profile.disable()
+
+        snapshot = None
+        if session.allocations and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            if session.started_tracemalloc:
+                tracemalloc.stop()
+        files = await asyncio.to_thread(self._write, session, snapshot)
+        logger.info("Profiling session finished: %d requests sampled, files %s", session.sampled, files)
+        return {"running": False, "session": session.to_dict(), "files": files}
+
+    def expire(self):
+        if self._stopping is None or self._stopping.done():
+            self._stopping = asyncio.ensure_future(self.stop())
+
+
+def _route_name(scope) -> Optional[str]:
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "name", None)
+    return None
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, profiler: Profiler, prefix: str = "/api"):
+        self.app = app
+        self.profiler = profiler
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        session = self.profiler.session
+        if session is None or scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+        if session.expired:
+            self.profiler.expire()
+            await self.app(scope, receive, send)
+            return
+        if not session.wants(scope) or not session.enter():
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if self.profiler.session is session:
+                session.exit()
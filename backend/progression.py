@@ -0,0 +1,264 @@
+"""Progression rules shared by the API, the event projections and batch jobs.
+
+Everything here is pure: level resolution from the cumulative XP table and
+achievement evaluation from player/stats documents, with no database access.
+"""
+from bisect import bisect_right
+from typing import Dict, List, Optional
+
+
+# ==================== XP CURVE ====================
+
+STARTING_COINS = 1000
+MAX_LEVEL = 100
+DLC_UNLOCK_LEVEL = 10
+
+# LEVEL_XP[i] is the lifetime XP needed to reach level i + 1; leaving level L costs L * 100 XP
+LEVEL_XP = [50 * level * (level - 1) for level in range(1, MAX_LEVEL + 1)]
+
+def level_progress(total_xp: int) -> Dict:
+    """Resolve lifetime XP into level, XP into that level and XP needed for the next one."""
+    total_xp = max(0, total_xp)
+    level = bisect_right(LEVEL_XP, total_xp)
+    xp_for_next_level = LEVEL_XP[level] - LEVEL_XP[level - 1] if level < MAX_LEVEL else 0
+    return {
+        "level": level,
+        "xp": total_xp - LEVEL_XP[level - 1],
+        "total_xp": total_xp,
+        "xp_for_next_level": xp_for_next_level,
+        "progress": (total_xp - LEVEL_XP[level - 1]) / xp_for_next_level if xp_for_next_level else 1.0,
+    }
+
+def total_xp_of(player: Dict) -> int:
+    """Lifetime XP of a player document, derived from level/xp for players created before total_xp existed."""
+    if player.get("total_xp") is not None:
+        return player["total_xp"]
+    return LEVEL_XP[min(player.get("level", 1), MAX_LEVEL) - 1] + player.get("xp", 0)
+
+def xp_grant_pipeline(xp: int) -> List[Dict]:
+    """Update pipeline that adds ``xp`` and re-resolves level/xp/unlocked_dlc inside Mongo."""
+    legacy_total = {"$add": [
+        {"$arrayElemAt": [LEVEL_XP, {"$subtract": [{"$min": [{"$ifNull": ["$level", 1]}, MAX_LEVEL]}, 1]}]},
+        {"$ifNull": ["$xp", 0]},
+    ]}
+    level = {"$size": {"$filter": {"input": LEVEL_XP, "cond": {"$lte": ["$$this", "$total_xp"]}}}}
+    return [
+        {"$set": {"total_xp": {"$max": [0, {"$add": [{"$ifNull": ["$total_xp", legacy_total]}, xp]}]}}},
+        {"$set": {"level": level}},
+        {"$set": {
+            "xp": {"$subtract": ["$total_xp", {"$arrayElemAt": [LEVEL_XP, {"$subtract": ["$level", 1]}]}]},
+            "unlocked_dlc": {"$or": [{"$ifNull": ["$unlocked_dlc", False]}, {"$gte": ["$level", DLC_UNLOCK_LEVEL]}]},
+        }},
+    ]
+
+
+# ==================== ACHIEVEMENT THRESHOLDS ====================
+
+# Counter name -> (source document, field)
+ACHIEVEMENT_COUNTERS = {
+    "kills": ("stats", "total_enemies_killed"),
+    "wins": ("stats", "total_wins"),
+    "games": ("stats", "total_games"),
+    "score": ("stats", "total_score"),
+    "bullets": ("stats", "total_bullets_shot"),
+    "specials": ("stats", "total_special_used"),
+    "spent": ("stats", "total_coins_spent"),
+    "purchases": ("stats", "total_purchases"),
+    "coins": ("player", "coins"),
+    "level": ("player", "level"),
+}
+
+# Counter-based achievements as (achievement_id, counter, target)
+ACHIEVEMENT_THRESHOLDS = [
+    ("first_blood", "kills", 1),
+    ("kill_5", "kills", 5),
+    ("kill_10", "kills", 10),
+    ("kill_25", "kills", 25),
+    ("kill_50", "kills", 50),
+    ("kill_100", "kills", 100),
+    ("kill_250", "kills", 250),
+    ("kill_500", "kills", 500),
+    ("first_win", "wins", 1),
+    ("win_5", "wins", 5),
+    ("win_10", "wins", 10),
+    ("win_25", "wins", 25),
+    ("play_10_games", "games", 10),
+    ("play_25_games", "games", 25),
+    ("play_50_games", "games", 50),
+    ("total_score_10k", "score", 10000),
+    ("total_score_50k", "score", 50000),
+    ("special_x10", "specials", 10),
+    ("special_x50", "specials", 50),
+    ("bullets_100", "bullets", 100),
+    ("bullets_500", "bullets", 500),
+    ("level_5", "level", 5),
+    ("level_10", "level", 10),
+    ("dlc_unlock", "level", DLC_UNLOCK_LEVEL),
+    ("level_15", "level", 15),
+    ("level_20", "level", 20),
+    ("coins_1000", "coins", 1000),
+    ("coins_2500", "coins", 2500),
+    ("coins_5000", "coins", 5000),
+    ("first_purchase", "purchases", 1),
+    ("buy_5", "purchases", 5),
+    ("buy_10", "purchases", 10),
+    ("buy_20", "purchases", 20),
+    ("spend_1000", "spent", 1000),
+]
+
+GAME_COUNTERS = ("kills", "wins", "games", "score", "specials", "bullets", "level", "coins")
+SHOP_COUNTERS = ("purchases", "spent")
+
+def achievement_counters(stats: Optional[Dict], player: Optional[Dict]) -> Dict[str, int]:
+    sources = {"stats": stats or {}, "player": player or {}}
+    return {
+        counter: sources[source].get(field) or (1 if counter == "level" else 0)
+        for counter, (source, field) in ACHIEVEMENT_COUNTERS.items()
+    }
+
+def reached_thresholds(counters: Dict[str, int], only: tuple = tuple(ACHIEVEMENT_COUNTERS)) -> List[str]:
+    """Ids of counter-based achievements whose target is met, limited to the ``only`` counters."""
+    return [
+        ach_id for ach_id, counter, target in ACHIEVEMENT_THRESHOLDS
+        if counter in only and counters[counter] >= target
+    ]
+
+
+# ==================== RULES ====================
+
+MAP_ACHIEVEMENTS = {
+    "roblox": "map_roblox",
+    "minecraft": "map_minecraft",
+    "youtube": "map_youtube",
+    "discord": "map_discord",
+}
+
+CHARACTER_WIN_ACHIEVEMENTS = {
+    "meultra4111": "meultra_win",
+    "olivo_10": "olivo_win",
+    "gato": "gato_win",
+    "jhon": "jhon_win",
+    "riptor": "riptor_win",
+    "martin": "martin_win",
+    "botsito": "botsito_win",
+    "brayan": "brayan_win",
+}
+
+DLC_CHARACTERS = ("thisand", "notfik", "nooblord")
+
+SPEED_DEMON_DURATION = 90
+SURVIVOR_HEALTH_RATIO = 0.1
+
+def win_achievements(character_id: Optional[str], speed: bool, perfect: bool, survivor: bool) -> List[str]:
+    """Achievements earned by a win with the given character and outcome."""
+    achievements = []
+    
+    if speed:
+        achievements.append("speed_demon")
+    if perfect:
+        achievements.append("perfect_game")
+    if survivor:
+        achievements.append("survivor")
+    
+    if character_id in CHARACTER_WIN_ACHIEVEMENTS:
+        achievements.append(CHARACTER_WIN_ACHIEVEMENTS[character_id])
+    
+    return achievements
+
+def session_result_achievements(session: Dict) -> List[str]:
+    """Achievements earned by the outcome of a single session, regardless of history."""
+    if not session.get("victory"):
+        return []
+    
+    # Health is only reported by newer clients; older sessions can't earn these
+    health, max_health = session.get("health_remaining"), session.get("max_health")
+    reported = health is not None and bool(max_health)
+    return win_achievements(
+        session.get("character_id"),
+        speed=session.get("duration", 0) < SPEED_DEMON_DURATION,
+        perfect=reported and health >= max_health,
+        survivor=reported and 0 < health < max_health * SURVIVOR_HEALTH_RATIO,
+    )
+
+def stats_achievements(stats: Dict) -> List[str]:
+    """Exploration achievements derived from the characters and maps a player has used."""
+    achievements = []
+    characters_played = stats.get("characters_played", [])
+    maps_played = stats.get("maps_played", [])
+    
+    if len(characters_played) >= 8:
+        achievements.append("all_chars")
+    
+    if all(c in characters_played for c in DLC_CHARACTERS):
+        achievements.append("all_dlc_chars")
+    
+    if len(maps_played) >= 4:
+        achievements.append("all_maps")
+    
+    achievements += [MAP_ACHIEVEMENTS[m] for m in MAP_ACHIEVEMENTS if m in maps_played]
+    
+    return achievements
+
+def session_achievements(stats: Dict, player: Optional[Dict], session: Dict) -> List[str]:
+    """Achievements earned on completing ``session``, given stats already updated with it."""
+    return (
+        reached_thresholds(achievement_counters(stats, player), GAME_COUNTERS)
+        + session_result_achievements(session)
+        + stats_achievements(stats)
+    )
+
+def history_achievements(player: Optional[Dict], stats: Optional[Dict], wins: List[Dict]) -> List[str]:
+    """Every rule-based achievement a player qualifies for given their documents and win history.
+
+    ``wins`` summarises the player's victories, one entry per character with
+    whether any of them was a ``speed``, ``perfect`` or ``survivor`` win.
+    """
+    achievements = reached_thresholds(achievement_counters(stats, player)) + stats_achievements(stats or {})
+    for win in wins:
+        achievements += win_achievements(win.get("character_id"), win["speed"], win["perfect"], win["survivor"])
+    return list(dict.fromkeys(achievements))
+
+def purchase_achievements(stats: Dict, player: Optional[Dict], item_type: str) -> List[str]:
+    """Achievements earned on a purchase, given stats already updated with it."""
+    achievements = reached_thresholds(achievement_counters(stats, player), SHOP_COUNTERS)
+    
+    if item_type == 'weapon':
+        achievements.append("buy_weapon")
+    
+    return achievements
+
+
+# ==================== STATS ====================
+
+def empty_stats(player_id: str) -> Dict:
+    return {
+        "player_id": player_id,
+        "total_enemies_killed": 0,
+        "total_wins": 0,
+        "total_games": 0,
+        "total_score": 0,
+        "total_bullets_shot": 0,
+        "total_special_used": 0,
+        "total_coins_spent": 0,
+        "total_purchases": 0,
+        "characters_played": [],
+        "maps_played": []
+    }
+
+def apply_session(stats: Dict, character_id: str, map_id: str, score: int, enemies_defeated: int,
+                  victory: bool, bullets_shot: int = 0, special_used: int = 0) -> Dict:
+    """Fold one completed session into a player_stats document in place."""
+    stats["total_enemies_killed"] = stats.get("total_enemies_killed", 0) + enemies_defeated
+    stats["total_wins"] = stats.get("total_wins", 0) + (1 if victory else 0)
+    stats["total_games"] = stats.get("total_games", 0) + 1
+    stats["total_score"] = stats.get("total_score", 0) + score
+    stats["total_bullets_shot"] = stats.get("total_bullets_shot", 0) + bullets_shot
+    stats["total_special_used"] = stats.get("total_special_used", 0) + special_used
+    
+    if character_id not in stats.setdefault("characters_played", []):
+        stats["characters_played"].append(character_id)
+    
+    if map_id not in stats.setdefault("maps_played", []):
+        stats["maps_played"].append(map_id)
+    
+    return stats
@@ -0,0 +1,142 @@
+"""Binary match replays stored on disk next to their game session.
+
+Format (little endian)::
+
+    header  <4sBxHH   magic b"MRPL", version, pad, canvas width, canvas height
+    frame   <HBHH     ms since previous frame, button bitmask, mouse x, mouse y
+
+Button bits: 0 up, 1 down, 2 left, 3 right, 4 shot fired, 5 special used.
+GameArena records one frame per update, so frames are fixed-size and a
+replay is ``HEADER.size + n * FRAME.size`` bytes.
+
+Uploads are streamed straight to ``<session_id>.mrpl.part`` and may be split
+across requests with ``Content-Range``; the file is validated and renamed
+into place once the last byte arrives. Downloads are served from a
+read-only memory map, honouring single ``Range`` requests.
+"""
+import mmap
+import os
+import re
+import struct
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
+
+
+ROOT_DIR = Path(__file__).parent
+
+REPLAY_DIR = Path(os.environ.get('REPLAY_DIR', ROOT_DIR / 'replays'))
+REPLAY_MAX_BYTES = int(os.environ.get('REPLAY_MAX_BYTES', 8 * 1024 * 1024))
+REPLAY_MAGIC = b"MRPL"
+REPLAY_VERSION = 1
+
+HEADER = struct.Struct("<4sBxHH")
+FRAME = struct.Struct("<HBHH")
+
+READ_CHUNK_SIZE = 64 * 1024
+WRITE_BUFFER_SIZE = 256 * 1024
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)$")
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+class ReplayError(ValueError):
+    def __init__(self, status_code: int, detail: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.headers = headers
+
+
+def replay_path(session_id: str) -> Path:
+    return REPLAY_DIR / f"{session_id}.mrpl"
+
+
+def parse_content_range(value: Optional[str]) -> Tuple[int, Optional[int], Optional[int]]:
+    """Return (start, end, total) for an upload; a missing header means one request with the whole file."""
+    if not value:
+        return 0, None, None
+    m = _CONTENT_RANGE.match(value.strip())
+    if not m:
+        raise ReplayError(400, "Invalid Content-Range")
+    start, end, total = (int(g) for g in m.groups())
+    if start > end or end >= total:
+        raise ReplayError(400, "Invalid Content-Range")
+    return start, end, total
+
+
+def _finalize(part: Path, final: Path) -> Dict[str, int]:
+    size = part.stat().st_size
+    with open(part, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        part.unlink()
+        raise ReplayError(422, "Replay is missing its header")
+    magic, version, width, height = HEADER.unpack(header)
+    if magic != REPLAY_MAGIC or version != REPLAY_VERSION or (size - HEADER.size) % FRAME.size:
+        part.unlink()
+        raise ReplayError(422, "Not a valid replay file")
+    os.replace(part, final)
+    return {"size": size, "frames": (size - HEADER.size) // FRAME.size, "width": width, "height": height}
+
+
+async def write_replay(session_id: str, chunks: AsyncIterator[bytes], content_range: Optional[str]) -> Dict:
+    """Append one upload request to the replay; returns its progress or the final replay info."""
+    final = replay_path(session_id)
+    if final.exists():
+        raise ReplayError(409, "Replay already uploaded")
+    start, end, total = parse_content_range(content_range)
+    if total is not None and total > REPLAY_MAX_BYTES:
+        raise ReplayError(413, "Replay too large")
+
+    REPLAY_DIR.mkdir(parents=True, exist_ok=True)
+    part = final.with_suffix(".mrpl.part")
+    offset = part.stat().st_size if part.exists() else 0
+    if start not in (0, offset):
+        raise ReplayError(409, "Upload offset mismatch", headers={"Upload-Offset": str(offset)})
+
+    written = start
+    buffer = bytearray()
+    with open(part, "r+b" if start else "wb") as f:
+        f.seek(start)
+        f.truncate()
+        async for chunk in chunks:
+            written += len(chunk)
+            if written > REPLAY_MAX_BYTES:
+                raise ReplayError(413, "Replay too large")
+            if end is not None and written > end + 1:
+                raise ReplayError(400, "Body does not match Content-Range")
+            buffer += chunk
+            if len(buffer) >= WRITE_BUFFER_SIZE:
+                f.write(buffer)
+                buffer.clear()
+        f.write(buffer)
+
+    if end is not None and written != end + 1:
+        raise ReplayError(400, "Body does not match Content-Range", headers={"Upload-Offset": str(written)})
+    if total is not None and written < total:
+        return {"complete": False, "offset": written}
+    return {"complete": True, **_finalize(part, final)}
+
+
+def parse_range(value: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Resolve a single ``Range`` header against ``size``; None means the whole file."""
+    if not value:
+        return None
+    m = _RANGE.match(value.strip())
+    if not m or m.groups() == ("", ""):
+        raise ReplayError(416, "Invalid range", headers={"Content-Range": f"bytes */{size}"})
+    first, last = m.groups()
+    if first == "":
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ReplayError(416, "Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def iter_replay(path: Path, start: int, end: int) -> Iterator[bytes]:
+    """Yield bytes ``start..end`` (inclusive) of a replay from a read-only memory map."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for offset in range(start, end + 1, READ_CHUNK_SIZE):
+            yield mm[offset:min(offset + READ_CHUNK_SIZE, end + 1)]
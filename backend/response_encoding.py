@@ -0,0 +1,168 @@
+"""Negotiated response encodings for the /api routes.
+
+* ``NegotiatedResponse`` renders MessagePack instead of JSON when the client
+  sends ``Accept: application/msgpack`` with a q value at least as high as
+  JSON's.
+* ``ResponseEncodingMiddleware`` compresses JSON/MessagePack bodies above a
+  size threshold with brotli or gzip, whichever ``Accept-Encoding`` gives the
+  higher q value (brotli on a tie).
+
+msgpack and brotli are optional; without them the matching encoding is
+simply never selected.
+"""
+import gzip
+from contextvars import ContextVar
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+COMPRESSIBLE_MEDIA_TYPES = ("application/json",) + MSGPACK_MEDIA_TYPES
+
+_wants_msgpack: ContextVar[bool] = ContextVar("wants_msgpack", default=False)
+
+
+class NegotiatedResponse(JSONResponse):
+    """JSONResponse that switches to MessagePack for clients that ask for it."""
+
+    def render(self, content) -> bytes:
+        if msgpack is not None and _wants_msgpack.get():
+            self.media_type = MSGPACK_MEDIA_TYPES[0]
+            return msgpack.packb(content, use_bin_type=True)
+        return super().render(content)
+
+    def init_headers(self, headers=None) -> None:
+        super().init_headers(headers)
+        if msgpack is not None:
+            self.headers.add_vary_header("Accept")
+
+
+def _q_values(header: str) -> dict:
+    """Parse an Accept-style header into {value: q}."""
+    values = {}
+    for part in header.split(","):
+        name, *params = part.split(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        values[name] = q
+    return values
+
+
+def _q(values: dict, name: str, *wildcards: str) -> float:
+    for key in (name,) + wildcards:
+        if key in values:
+            return values[key]
+    return 0.0
+
+
+def _negotiate_encoding(header: str) -> Optional[str]:
+    codings = _q_values(header)
+    best, best_q = None, 0.0
+    # Listed in order of preference, so brotli wins a tie
+    for coding in (("br",) if brotli is not None else ()) + ("gzip",):
+        q = _q(codings, coding, "*")
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def _prefers_msgpack(header: str) -> bool:
+    types = _q_values(header)
+    msgpack_q = max(types.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES)
+    return msgpack_q > 0 and msgpack_q >= _q(types, "application/json", "application/*", "*/*")
+
+
+class ResponseEncodingMiddleware:
+    def __init__(self, app, minimum_size: int = 500, prefix: str = "/api", gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.prefix = prefix
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        token = _wants_msgpack.set(_prefers_msgpack(headers.get("accept", "")))
+        try:
+            encoding = _negotiate_encoding(headers.get("accept-encoding", ""))
+            if encoding is None:
+                await self.app(scope, receive, send)
+            else:
+                await self.app(scope, receive, _CompressingSend(send, encoding, self))
+        finally:
+            _wants_msgpack.reset(token)
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+
+class _CompressingSend:
+    """Buffers a compressible response body and compresses it once complete."""
+
+    def __init__(self, send, encoding: str, middleware: ResponseEncodingMiddleware):
+        self.send = send
+        self.encoding = encoding
+        self.middleware = middleware
+        self.start_message = None
+        self.passthrough = False
+        self.chunks = []
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            media_type = headers.get("content-type", "").split(";")[0].strip()
+            self.passthrough = (
+                media_type not in COMPRESSIBLE_MEDIA_TYPES
+                or "content-encoding" in headers
+                or message["status"] == 206
+            )
+            if self.passthrough:
+                await self.send(message)
+            else:
+                self.start_message = message
+            return
+
+        if self.passthrough or message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        self.chunks.append(message.get("body", b""))
+        if message.get("more_body", False):
+            return
+
+        body = b"".join(self.chunks)
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        if len(body) >= self.middleware.minimum_size:
+            body = self.middleware.compress(body, self.encoding)
+            headers["Content-Encoding"] = self.encoding
+            headers["Content-Length"] = str(len(body))
+        headers.add_vary_header("Accept-Encoding")
+        await self.send(self.start_message)
+        await self.send({"type": "http.response.body", "body": body})
@@ -1,26 +1,62 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Header
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import hmac
+import itertools
+import time
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, model_validator
 from typing import List, Optional, Dict
+from collections import OrderedDict
 import uuid
 from datetime import datetime, timezone
 
+from session_archive import find_archived_session, read_archived_sessions
+from challenges import current_challenges
+from store import Store, make_event
+from response_encoding import NegotiatedResponse, ResponseEncodingMiddleware
+from admission import AdmissionController
+from single_flight import SingleFlight
+from matchmaking import Matchmaker, Ticket
+from replays import ReplayError, iter_replay, parse_range, replay_path, write_replay
+from tracing import MongoCommandTracer, TraceExporter, TracingMiddleware, span
+from profiling import Profiler, ProfilingMiddleware
+from progression import (
+    ACHIEVEMENT_THRESHOLDS,
+    STARTING_COINS,
+    achievement_counters,
+    apply_session,
+    empty_stats,
+    level_progress,
+    purchase_achievements,
+    session_achievements,
+    total_xp_of,
+    xp_grant_pipeline,
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandTracer()])
 db = client[os.environ['DB_NAME']]
+store = Store(db)
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=NegotiatedResponse)
+
+# Request tracing: span trees of slow requests are logged, a sample is exported
+tracer = TraceExporter(
+    path=Path(os.environ['TRACE_EXPORT_PATH']) if os.environ.get('TRACE_EXPORT_PATH') else None,
+    sample_rate=float(os.environ.get('TRACE_SAMPLE_RATE', 0.01)),
+    slow_ms=float(os.environ.get('TRACE_SLOW_MS', 500)),
+)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -48,10 +84,18 @@ class Player(BaseModel):
     username: str
     level: int = 1
     xp: int = 0
-    coins: int = 1000
+    total_xp: int = 0
+    coins: int = STARTING_COINS
     unlocked_dlc: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+    @model_validator(mode="before")
+    @classmethod
+    def derive_total_xp(cls, data):
+        if isinstance(data, dict) and data.get("total_xp") is None and "level" in data:
+            data = {**data, "total_xp": total_xp_of(data)}
+        return data
+
 class Achievement(BaseModel):
     model_config = ConfigDict(extra="ignore")
     achievement_id: str
@@ -79,6 +123,10 @@ class GameSession(BaseModel):
     xp_earned: int = 0
     coins_earned: int = 0
     duration: int = 0
+    health_remaining: Optional[int] = None
+    max_health: Optional[int] = None
+    match_id: Optional[str] = None
+    replay: Optional[Dict] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class ShopItem(BaseModel):
@@ -107,6 +155,7 @@ class PlayerStats(BaseModel):
     total_bullets_shot: int = 0
     total_special_used: int = 0
     total_coins_spent: int = 0
+    total_purchases: int = 0
     characters_played: List[str] = []
     maps_played: List[str] = []
 
@@ -127,11 +176,131 @@ class GameSessionUpdate(BaseModel):
     duration: int
     bullets_shot: int = 0
     special_used: int = 0
+    health_remaining: Optional[int] = None
+    max_health: Optional[int] = None
 
 class PurchaseItem(BaseModel):
     player_id: str
     item_id: str
 
+class ProfilingRequest(BaseModel):
+    routes: Optional[List[str]] = None
+    sample_rate: float = Field(0.1, gt=0, le=1)
+    duration: float = Field(60, gt=0, le=3600)
+    allocations: bool = False
+
+class MatchmakingRequest(BaseModel):
+    player_id: str
+    character_id: str
+    map_id: str
+
+
+# ==================== ACHIEVEMENT PROGRESS CACHE ====================
+
+ACHIEVEMENT_PROGRESS_TTL = float(os.environ.get('ACHIEVEMENT_PROGRESS_TTL', 30))
+ACHIEVEMENT_PROGRESS_CACHE_SIZE = int(os.environ.get('ACHIEVEMENT_PROGRESS_CACHE_SIZE', 10000))
+
+# player_id -> (expires_at, progress); invalidated by every route that writes player progress
+_achievement_progress_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+# player_id -> generation bumped by every invalidation, so a read that raced a
+# write knows not to cache. Generations come from one counter and are evicted
+# oldest first; evicted players fall back to the newest evicted generation.
+_write_generations: "OrderedDict[str, int]" = OrderedDict()
+_next_write_generation = itertools.count(1)
+_evicted_write_generation = 0
+
+# Coalesces concurrent identical per-player reads into one in-flight query
+single_flight = SingleFlight()
+
+def player_write_generation(player_id: str) -> int:
+    return _write_generations.get(player_id, _evicted_write_generation)
+
+def invalidate_player_reads(player_id: str):
+    """Drop cached progress and detach in-flight reads after a write to this player."""
+    global _evicted_write_generation
+    _write_generations[player_id] = next(_next_write_generation)
+    _write_generations.move_to_end(player_id)
+    if len(_write_generations) > ACHIEVEMENT_PROGRESS_CACHE_SIZE:
+        _, _evicted_write_generation = _write_generations.popitem(last=False)
+    _achievement_progress_cache.pop(player_id, None)
+    single_flight.forget(("player", player_id), ("player_stats", player_id), ("player_achievements", player_id))
+
+
+# ==================== ADMIN ====================
+
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    # Admin routes are disabled unless ADMIN_TOKEN is configured
+    if not ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+profiler = Profiler()
+
+
+# ==================== ADMISSION CONTROL ====================
+
+admission = AdmissionController(
+    rate=float(os.environ.get('ADMISSION_RATE_PER_PLAYER', 5)),
+    burst=float(os.environ.get('ADMISSION_BURST_PER_PLAYER', 10)),
+    max_concurrency=int(os.environ.get('ADMISSION_MAX_CONCURRENCY', 50)),
+    max_queue=int(os.environ.get('ADMISSION_MAX_QUEUE', 200)),
+    queue_timeout=float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 2)),
+)
+
+# Route dependencies; handlers that call each other directly (e.g. update_game_session -> add_xp) are not re-admitted
+async def admit_player(player_id: str):
+    async with admission.admit(player_id):
+        yield
+
+async def admit_purchase(purchase: PurchaseItem):
+    async with admission.admit(purchase.player_id):
+        yield
+
+async def admit_db_heavy():
+    async with admission.admit():
+        yield
+
+
+# ==================== ACHIEVEMENT UNLOCKS ====================
+
+async def unlock_achievements(player_id: str, achievement_ids: List[str], source: str = "rules"):
+    """Insert the achievements the player doesn't have yet and log them."""
+    unlocked = await store.insert_achievements(player_id, achievement_ids)
+    await store.append_events([
+        make_event("achievement_unlocked", player_id, {"achievement_id": ach_id, "source": source})
+        for ach_id in unlocked
+    ])
+
+
+# ==================== MATCHMAKING ====================
+
+async def create_match_sessions(a: Ticket, b: Ticket, match_id: str) -> Dict[str, str]:
+    """Create one GameSession per matched player, linked by match_id."""
+    sessions = [
+        GameSession(player_id=t.player_id, character_id=t.character_id, map_id=t.map_id, match_id=match_id)
+        for t in (a, b)
+    ]
+    docs = []
+    for session in sessions:
+        doc = session.model_dump()
+        doc['created_at'] = doc['created_at'].isoformat()
+        docs.append(doc)
+    await store.insert_sessions(docs)
+    return {session.player_id: session.session_id for session in sessions}
+
+matchmaker = Matchmaker(
+    create_match_sessions,
+    bucket_size=int(os.environ.get('MATCHMAKING_BUCKET_SIZE', 5)),
+    base_window=int(os.environ.get('MATCHMAKING_BASE_WINDOW', 2)),
+    widen_per_second=float(os.environ.get('MATCHMAKING_WIDEN_PER_SECOND', 1)),
+    max_window=int(os.environ.get('MATCHMAKING_MAX_WINDOW', 30)),
+    tick_interval=float(os.environ.get('MATCHMAKING_TICK_INTERVAL', 0.5)),
+    max_scans=int(os.environ.get('MATCHMAKING_MAX_SCANS_PER_TICK', 2000)),
+    queue_ttl=float(os.environ.get('MATCHMAKING_QUEUE_TTL', 30)),
+)
+
 
 # ==================== ROUTES ====================
 
@@ -171,51 +340,44 @@ async def create_player(player_input: PlayerCreate):
     player = Player(username=player_input.username)
     doc = player.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
-    await db.players.insert_one(doc)
+    await store.insert_player(doc)
+    await store.append_event("player_created", player.player_id, {"coins": player.coins})
     return player
 
 @api_router.get("/players/{player_id}", response_model=Player)
 async def get_player(player_id: str):
-    player = await db.players.find_one({"player_id": player_id}, {"_id": 0})
+    player = await single_flight.do(
+        ("player", player_id),
+        lambda: store.get_player(player_id)
+    )
     if not player:
         raise HTTPException(status_code=404, detail="Player not found")
     if isinstance(player.get('created_at'), str):
         player['created_at'] = datetime.fromisoformat(player['created_at'])
     return Player(**player)
 
-@api_router.put("/players/{player_id}/xp")
+@api_router.put("/players/{player_id}/xp", dependencies=[Depends(admit_player)])
 async def add_xp(player_id: str, xp: int):
-    player = await db.players.find_one({"player_id": player_id}, {"_id": 0})
-    if not player:
+    updated_player = await store.update_player(player_id, xp_grant_pipeline(xp), return_document=True)
+    if not updated_player:
         raise HTTPException(status_code=404, detail="Player not found")
+    invalidate_player_reads(player_id)
+    await store.append_event("xp_granted", player_id, {"xp": xp})
     
-    new_xp = player['xp'] + xp
-    new_level = player['level']
-    xp_for_next_level = new_level * 100
-    
-    if new_xp >= xp_for_next_level:
-        new_level += 1
-        new_xp = new_xp - xp_for_next_level
-    
-    if new_level >= 10 and not player.get('unlocked_dlc', False):
-        await db.players.update_one(
-            {"player_id": player_id},
-            {"$set": {"xp": new_xp, "level": new_level, "unlocked_dlc": True}}
-        )
-    else:
-        await db.players.update_one(
-            {"player_id": player_id},
-            {"$set": {"xp": new_xp, "level": new_level}}
-        )
-    
-    updated_player = await db.players.find_one({"player_id": player_id}, {"_id": 0})
     if isinstance(updated_player.get('created_at'), str):
         updated_player['created_at'] = datetime.fromisoformat(updated_player['created_at'])
     return Player(**updated_player)
 
-@api_router.put("/players/{player_id}/coins")
+@api_router.get("/players/{player_id}/level")
+async def get_player_level(player_id: str):
+    player = await store.get_player(player_id, ["level", "xp", "total_xp"])
+    if not player:
+        raise HTTPException(status_code=404, detail="Player not found")
+    return level_progress(total_xp_of(player))
+
+@api_router.put("/players/{player_id}/coins", dependencies=[Depends(admit_player)])
 async def update_coins(player_id: str, amount: int):
-    player = await db.players.find_one({"player_id": player_id}, {"_id": 0})
+    player = await store.get_player(player_id)
     if not player:
         raise HTTPException(status_code=404, detail="Player not found")
     
@@ -223,12 +385,11 @@ async def update_coins(player_id: str, amount: int):
     if new_coins < 0:
         raise HTTPException(status_code=400, detail="Insufficient coins")
     
-    await db.players.update_one(
-        {"player_id": player_id},
-        {"$set": {"coins": new_coins}}
-    )
+    await store.update_player(player_id, {"$set": {"coins": new_coins}})
+    invalidate_player_reads(player_id)
+    await store.append_event("coins_changed", player_id, {"amount": amount})
     
-    updated_player = await db.players.find_one({"player_id": player_id}, {"_id": 0})
+    updated_player = await store.get_player(player_id)
     if isinstance(updated_player.get('created_at'), str):
         updated_player['created_at'] = datetime.fromisoformat(updated_player['created_at'])
     return Player(**updated_player)
@@ -243,196 +404,206 @@ async def create_game_session(session_input: GameSessionCreate):
     )
     doc = session.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
-    await db.game_sessions.insert_one(doc)
+    await store.insert_sessions([doc])
     return session
 
-@api_router.put("/game/session/{session_id}")
-async def update_game_session(session_id: str, update: GameSessionUpdate):
-    session = await db.game_sessions.find_one({"session_id": session_id}, {"_id": 0})
+async def resolve_session_owner(session_id: str, archived: bool = False) -> str:
+    player_id = await store.find_session_owner(session_id)
+    if not player_id and archived:
+        session = await find_archived_session(session_id)
+        player_id = session and session["player_id"]
+    if not player_id:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return player_id
+
+@api_router.put("/players/{player_id}/sessions/{session_id}", dependencies=[Depends(admit_db_heavy)])
+async def update_game_session(player_id: str, session_id: str, update: GameSessionUpdate):
+    session = await store.get_session(player_id, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
     xp_earned = update.enemies_defeated * 10 + (50 if update.victory else 0)
     coins_earned = update.enemies_defeated * 5 + (100 if update.victory else 25)
     
-    await db.game_sessions.update_one(
-        {"session_id": session_id},
-        {"$set": {
-            "score": update.score,
-            "enemies_defeated": update.enemies_defeated,
-            "victory": update.victory,
-            "duration": update.duration,
-            "xp_earned": xp_earned,
-            "coins_earned": coins_earned
-        }}
-    )
-    
-    player_id = session['player_id']
-    await add_xp(player_id, xp_earned)
-    await update_coins(player_id, coins_earned)
-    
-    stats = await db.player_stats.find_one({"player_id": player_id}, {"_id": 0})
-    if not stats:
-        stats = {
-            "player_id": player_id,
-            "total_enemies_killed": 0,
-            "total_wins": 0,
-            "total_games": 0,
-            "total_score": 0,
-            "total_bullets_shot": 0,
-            "total_special_used": 0,
-            "total_coins_spent": 0,
-            "characters_played": [],
-            "maps_played": []
-        }
+    with span("session.challenges"):
+        challenges = current_challenges()
+        increments = challenges.increments({**session, **update.model_dump()})
+        challenges_completed = []
+        if increments:
+            progress = await store.add_challenge_progress(player_id, challenges.week_key, increments)
+            challenges_completed = challenges.newly_completed(progress, increments)
+        xp_earned += sum(c.reward["xp"] for c in challenges_completed)
+        coins_earned += sum(c.reward["coins"] for c in challenges_completed)
+    
+    await store.update_session(player_id, session_id, {
+        "score": update.score,
+        "enemies_defeated": update.enemies_defeated,
+        "victory": update.victory,
+        "duration": update.duration,
+        "health_remaining": update.health_remaining,
+        "max_health": update.max_health,
+        "xp_earned": xp_earned,
+        "coins_earned": coins_earned
+    })
     
-    stats["total_enemies_killed"] = stats.get("total_enemies_killed", 0) + update.enemies_defeated
-    stats["total_wins"] = stats.get("total_wins", 0) + (1 if update.victory else 0)
-    stats["total_games"] = stats.get("total_games", 0) + 1
-    stats["total_score"] = stats.get("total_score", 0) + update.score
-    stats["total_bullets_shot"] = stats.get("total_bullets_shot", 0) + update.bullets_shot
-    stats["total_special_used"] = stats.get("total_special_used", 0) + update.special_used
-    
-    if session['character_id'] not in stats.get("characters_played", []):
-        if "characters_played" not in stats:
-            stats["characters_played"] = []
-        stats["characters_played"].append(session['character_id'])
-    
-    if session['map_id'] not in stats.get("maps_played", []):
-        if "maps_played" not in stats:
-            stats["maps_played"] = []
-        stats["maps_played"].append(session['map_id'])
-    
-    await db.player_stats.update_one(
-        {"player_id": player_id},
-        {"$set": stats},
-        upsert=True
-    )
+    with span("session.rewards", xp=xp_earned, coins=coins_earned):
+        await add_xp(player_id, xp_earned)
+        await update_coins(player_id, coins_earned)
     
-    achievements_to_unlock = []
-    
-    if stats["total_enemies_killed"] >= 1:
-        achievements_to_unlock.append("first_blood")
-    if stats["total_enemies_killed"] >= 5:
-        achievements_to_unlock.append("kill_5")
-    if stats["total_enemies_killed"] >= 10:
-        achievements_to_unlock.append("kill_10")
-    if stats["total_enemies_killed"] >= 25:
-        achievements_to_unlock.append("kill_25")
-    if stats["total_enemies_killed"] >= 50:
-        achievements_to_unlock.append("kill_50")
-    if stats["total_enemies_killed"] >= 100:
-        achievements_to_unlock.append("kill_100")
-    if stats["total_enemies_killed"] >= 250:
-        achievements_to_unlock.append("kill_250")
-    if stats["total_enemies_killed"] >= 500:
-        achievements_to_unlock.append("kill_500")
-    
-    if stats["total_wins"] >= 1:
-        achievements_to_unlock.append("first_win")
-    if stats["total_wins"] >= 5:
-        achievements_to_unlock.append("win_5")
-    if stats["total_wins"] >= 10:
-        achievements_to_unlock.append("win_10")
-    if stats["total_wins"] >= 25:
-        achievements_to_unlock.append("win_25")
-    
-    if stats["total_games"] >= 10:
-        achievements_to_unlock.append("play_10_games")
-    if stats["total_games"] >= 25:
-        achievements_to_unlock.append("play_25_games")
-    if stats["total_games"] >= 50:
-        achievements_to_unlock.append("play_50_games")
-    
-    if stats["total_score"] >= 10000:
-        achievements_to_unlock.append("total_score_10k")
-    if stats["total_score"] >= 50000:
-        achievements_to_unlock.append("total_score_50k")
-    
-    if stats["total_special_used"] >= 10:
-        achievements_to_unlock.append("special_x10")
-    if stats["total_special_used"] >= 50:
-        achievements_to_unlock.append("special_x50")
-    
-    if stats["total_bullets_shot"] >= 100:
-        achievements_to_unlock.append("bullets_100")
-    if stats["total_bullets_shot"] >= 500:
-        achievements_to_unlock.append("bullets_500")
-    
-    if update.victory and update.duration < 90:
-        achievements_to_unlock.append("speed_demon")
-    
-    if len(stats.get("characters_played", [])) >= 8:
-        achievements_to_unlock.append("all_chars")
-    
-    if len(stats.get("maps_played", [])) >= 4:
-        achievements_to_unlock.append("all_maps")
-    
-    if "roblox" in stats.get("maps_played", []):
-        achievements_to_unlock.append("map_roblox")
-    if "minecraft" in stats.get("maps_played", []):
-        achievements_to_unlock.append("map_minecraft")
-    if "youtube" in stats.get("maps_played", []):
-        achievements_to_unlock.append("map_youtube")
-    if "discord" in stats.get("maps_played", []):
-        achievements_to_unlock.append("map_discord")
-    
-    if update.victory:
-        char_id = session['character_id']
-        if char_id == "meultra4111":
-            achievements_to_unlock.append("meultra_win")
-        elif char_id == "olivo_10":
-            achievements_to_unlock.append("olivo_win")
-        elif char_id == "gato":
-            achievements_to_unlock.append("gato_win")
-        elif char_id == "jhon":
-            achievements_to_unlock.append("jhon_win")
-    
-    player = await db.players.find_one({"player_id": player_id}, {"_id": 0})
-    if player:
-        if player.get("level", 1) >= 5:
-            achievements_to_unlock.append("level_5")
-        if player.get("level", 1) >= 10:
-            achievements_to_unlock.append("level_10")
-            achievements_to_unlock.append("dlc_unlock")
-        if player.get("level", 1) >= 15:
-            achievements_to_unlock.append("level_15")
-        if player.get("level", 1) >= 20:
-            achievements_to_unlock.append("level_20")
+    with span("session.stats_update"):
+        stats = await store.get_stats(player_id)
+        if not stats:
+            stats = empty_stats(player_id)
+        
+        apply_session(
+            stats, session['character_id'], session['map_id'], update.score, update.enemies_defeated,
+            update.victory, update.bullets_shot, update.special_used
+        )
         
-        if player.get("coins", 0) >= 1000:
-            achievements_to_unlock.append("coins_1000")
-        if player.get("coins", 0) >= 2500:
-            achievements_to_unlock.append("coins_2500")
-        if player.get("coins", 0) >= 5000:
-            achievements_to_unlock.append("coins_5000")
-    
-    for ach_id in achievements_to_unlock:
-        existing = await db.player_achievements.find_one({
-            "player_id": player_id,
-            "achievement_id": ach_id
+        await store.set_stats(player_id, stats)
+        await store.append_event("session_completed", player_id, {
+            "session_id": session_id,
+            "character_id": session['character_id'],
+            "map_id": session['map_id'],
+            **update.model_dump(),
         })
-        if not existing:
-            pa = PlayerAchievement(player_id=player_id, achievement_id=ach_id, unlocked_at=datetime.now(timezone.utc))
-            doc = pa.model_dump()
-            doc['unlocked_at'] = doc['unlocked_at'].isoformat()
-            await db.player_achievements.insert_one(doc)
+    
+    with span("session.achievements") as step:
+        player = await store.get_player(player_id)
+        achievements_to_unlock = session_achievements(stats, player, {**session, **update.model_dump()})
+        await unlock_achievements(player_id, achievements_to_unlock)
+        if step:
+            step.attributes["unlocked"] = len(achievements_to_unlock)
+    invalidate_player_reads(player_id)
     
     return {
         "xp_earned": xp_earned,
         "coins_earned": coins_earned,
         "achievements_unlocked": len(achievements_to_unlock),
+        "challenges_completed": [c.to_dict() for c in challenges_completed],
         "message": "Session completed"
     }
 
+@api_router.put("/game/session/{session_id}", dependencies=[Depends(admit_db_heavy)])
+async def update_game_session_by_id(session_id: str, update: GameSessionUpdate):
+    # Kept for older clients; prefer the player-scoped route, which is shard-targeted
+    return await update_game_session(await resolve_session_owner(session_id), session_id, update)
+
 @api_router.get("/game/sessions/{player_id}", response_model=List[GameSession])
-async def get_player_sessions(player_id: str):
-    sessions = await db.game_sessions.find({"player_id": player_id}, {"_id": 0}).to_list(100)
+async def get_player_sessions(player_id: str, skip: int = 0, limit: int = 100):
+    hot_count = await store.count_sessions(player_id)
+    sessions = []
+    if skip < hot_count:
+        sessions = await store.list_sessions(player_id, skip, limit)
+    
+    # Pages past the end of the hot collection come from the Parquet archive,
+    # minus sessions an interrupted archive run left in both places
+    if len(sessions) < limit and await store.has_archived_sessions(player_id):
+        sessions += await read_archived_sessions(
+            player_id, max(0, skip - hot_count), limit - len(sessions),
+            exclude=await store.list_session_ids(player_id)
+        )
+    
     for session in sessions:
         if isinstance(session.get('created_at'), str):
             session['created_at'] = datetime.fromisoformat(session['created_at'])
     return [GameSession(**s) for s in sessions]
 
+# ===== MATCHMAKING =====
+@api_router.post("/matchmaking/queue")
+async def enqueue_matchmaking(request: MatchmakingRequest):
+    player = await store.get_player(request.player_id, ["level"])
+    if not player:
+        raise HTTPException(status_code=404, detail="Player not found")
+    await get_character(request.character_id)
+    if request.map_id not in {m["id"] for m in await get_maps()}:
+        raise HTTPException(status_code=404, detail="Map not found")
+    
+    ticket = matchmaker.enqueue(request.player_id, request.character_id, request.map_id, player.get("level", 1))
+    return ticket.to_dict()
+
+@api_router.get("/matchmaking/queue/{player_id}")
+async def get_matchmaking_status(player_id: str):
+    ticket = matchmaker.status(player_id)
+    if not ticket:
+        raise HTTPException(status_code=404, detail="Player is not in matchmaking")
+    return ticket.to_dict()
+
+@api_router.delete("/matchmaking/queue/{player_id}")
+async def cancel_matchmaking(player_id: str):
+    if not matchmaker.cancel(player_id):
+        raise HTTPException(status_code=404, detail="Player is not in matchmaking")
+    return {"message": "Left matchmaking queue"}
+
+# ===== REPLAYS =====
+@api_router.put("/players/{player_id}/sessions/{session_id}/replay")
+async def upload_replay(player_id: str, session_id: str, request: Request):
+    session = await store.get_session(player_id, session_id, ["session_id"])
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    try:
+        result = await write_replay(session_id, request.stream(), request.headers.get("content-range"))
+    except ReplayError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
+    
+    if result["complete"]:
+        await store.update_session(player_id, session_id, {"replay": {
+            "size": result["size"],
+            "frames": result["frames"],
+            "uploaded_at": datetime.now(timezone.utc).isoformat()
+        }})
+    return result
+
+@api_router.get("/players/{player_id}/sessions/{session_id}/replay")
+async def download_replay(player_id: str, session_id: str, request: Request):
+    session = await store.get_session(player_id, session_id, ["session_id"])
+    # Replays stay on disk after their session is moved to the archive
+    if not session and await store.has_archived_sessions(player_id):
+        session = await find_archived_session(session_id, player_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    path = replay_path(session_id)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Replay not found")
+    
+    size = path.stat().st_size
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except ReplayError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
+    
+    start, end = byte_range or (0, size - 1)
+    headers = {"Accept-Ranges": "bytes", "Content-Length": str(end - start + 1)}
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(
+        iter_replay(path, start, end),
+        status_code=206 if byte_range else 200,
+        media_type="application/octet-stream",
+        headers=headers
+    )
+
+@api_router.put("/game/session/{session_id}/replay")
+async def upload_replay_by_id(session_id: str, request: Request):
+    return await upload_replay(await resolve_session_owner(session_id), session_id, request)
+
+@api_router.get("/game/session/{session_id}/replay")
+async def download_replay_by_id(session_id: str, request: Request):
+    return await download_replay(await resolve_session_owner(session_id, archived=True), session_id, request)
+
+# ===== CHALLENGES =====
+@api_router.get("/challenges")
+async def get_challenges():
+    return current_challenges().to_dict()
+
+@api_router.get("/challenges/{player_id}")
+async def get_player_challenges(player_id: str):
+    challenges = current_challenges()
+    progress = await store.get_challenge_progress(player_id, challenges.week_key)
+    return challenges.to_dict(progress)
+
 # ===== ACHIEVEMENTS =====
 @api_router.get("/achievements")
 async def get_achievements():
@@ -481,6 +652,10 @@ async def get_achievements():
         {"achievement_id": "olivo_win", "title": "Golpe Pesado", "description": "Gana con Olivo_10", "category": "characters", "icon": "🔨"},
         {"achievement_id": "gato_win", "title": "Velocidad Felina", "description": "Gana con Gato", "category": "characters", "icon": "🐱"},
         {"achievement_id": "jhon_win", "title": "Sombra Mortal", "description": "Gana con Jhon", "category": "characters", "icon": "🗡️"},
+        {"achievement_id": "riptor_win", "title": "Furia Salvaje", "description": "Gana con Riptor", "category": "characters", "icon": "🦖"},
+        {"achievement_id": "martin_win", "title": "Archimago", "description": "Gana con Martin", "category": "characters", "icon": "🔮"},
+        {"achievement_id": "botsito_win", "title": "Muro de Hierro", "description": "Gana con Botsito", "category": "characters", "icon": "🤖"},
+        {"achievement_id": "brayan_win", "title": "Instinto Bestial", "description": "Gana con Brayan", "category": "characters", "icon": "🐕"},
         {"achievement_id": "play_10_games", "title": "Dedicado", "description": "Juega 10 partidas", "category": "special", "icon": "🎮"},
         {"achievement_id": "play_25_games", "title": "Adicto", "description": "Juega 25 partidas", "category": "special", "icon": "🕹️"},
         {"achievement_id": "play_50_games", "title": "Pro Gamer", "description": "Juega 50 partidas", "category": "special", "icon": "🏅"},
@@ -492,7 +667,10 @@ async def get_achievements():
 
 @api_router.get("/achievements/{player_id}")
 async def get_player_achievements(player_id: str):
-    player_achievements = await db.player_achievements.find({"player_id": player_id}, {"_id": 0}).to_list(100)
+    player_achievements = await single_flight.do(
+        ("player_achievements", player_id),
+        lambda: store.list_achievements(player_id)
+    )
     all_achievements = await get_achievements()
     
     unlocked_ids = {pa['achievement_id'] for pa in player_achievements}
@@ -504,20 +682,49 @@ async def get_player_achievements(player_id: str):
     
     return result
 
+@api_router.get("/achievements/{player_id}/progress")
+async def get_achievement_progress(player_id: str):
+    cached = _achievement_progress_cache.get(player_id)
+    if cached and cached[0] > time.monotonic():
+        _achievement_progress_cache.move_to_end(player_id)
+        return cached[1]
+    
+    generation = player_write_generation(player_id)
+    player, stats = await asyncio.gather(
+        store.get_player(player_id, ["level", "coins"]),
+        store.get_stats(player_id),
+    )
+    if not player:
+        raise HTTPException(status_code=404, detail="Player not found")
+    
+    counters = achievement_counters(stats, player)
+    progress = [
+        {
+            "achievement_id": ach_id,
+            "counter": counter,
+            "current": counters[counter],
+            "target": target,
+            "completed": counters[counter] >= target,
+        }
+        for ach_id, counter, target in ACHIEVEMENT_THRESHOLDS
+    ]
+    
+    # A write landed while we were reading, so this progress may predate it
+    if player_write_generation(player_id) != generation:
+        return progress
+    
+    _achievement_progress_cache[player_id] = (time.monotonic() + ACHIEVEMENT_PROGRESS_TTL, progress)
+    if len(_achievement_progress_cache) > ACHIEVEMENT_PROGRESS_CACHE_SIZE:
+        _achievement_progress_cache.popitem(last=False)
+    return progress
+
 @api_router.post("/achievements/{player_id}/{achievement_id}")
 async def unlock_achievement(player_id: str, achievement_id: str):
-    existing = await db.player_achievements.find_one({
-        "player_id": player_id,
-        "achievement_id": achievement_id
-    }, {"_id": 0})
-    
-    if existing:
+    if await store.has_achievement(player_id, achievement_id):
         return {"message": "Achievement already unlocked"}
     
-    pa = PlayerAchievement(player_id=player_id, achievement_id=achievement_id, unlocked_at=datetime.now(timezone.utc))
-    doc = pa.model_dump()
-    doc['unlocked_at'] = doc['unlocked_at'].isoformat()
-    await db.player_achievements.insert_one(doc)
+    await unlock_achievements(player_id, [achievement_id], source="manual")
+    invalidate_player_reads(player_id)
     
     return {"message": "Achievement unlocked!"}
 
@@ -544,9 +751,9 @@ async def get_shop_weapons():
     ]
     return weapons
 
-@api_router.post("/shop/purchase")
+@api_router.post("/shop/purchase", dependencies=[Depends(admit_purchase)])
 async def purchase_item(purchase: PurchaseItem):
-    player = await db.players.find_one({"player_id": purchase.player_id}, {"_id": 0})
+    player = await store.get_player(purchase.player_id)
     if not player:
         raise HTTPException(status_code=404, detail="Player not found")
     
@@ -559,78 +766,87 @@ async def purchase_item(purchase: PurchaseItem):
     if player['coins'] < item['price']:
         raise HTTPException(status_code=400, detail="Insufficient coins")
     
-    await update_coins(purchase.player_id, -item['price'])
+    with span("purchase.charge", price=item['price']):
+        await update_coins(purchase.player_id, -item['price'])
     
-    inventory_item = PlayerInventory(player_id=purchase.player_id, item_id=purchase.item_id)
-    doc = inventory_item.model_dump()
-    doc['purchased_at'] = doc['purchased_at'].isoformat()
-    await db.player_inventory.insert_one(doc)
-    
-    stats = await db.player_stats.find_one({"player_id": purchase.player_id}, {"_id": 0})
-    if not stats:
-        stats = {"player_id": purchase.player_id, "total_coins_spent": 0}
-    
-    stats["total_coins_spent"] = stats.get("total_coins_spent", 0) + item['price']
-    await db.player_stats.update_one(
-        {"player_id": purchase.player_id},
-        {"$set": {"total_coins_spent": stats["total_coins_spent"]}},
-        upsert=True
-    )
-    
-    inventory_count = await db.player_inventory.count_documents({"player_id": purchase.player_id})
-    
-    achievements_to_unlock = []
-    if inventory_count >= 1:
-        achievements_to_unlock.append("first_purchase")
-    if inventory_count >= 5:
-        achievements_to_unlock.append("buy_5")
-    if inventory_count >= 10:
-        achievements_to_unlock.append("buy_10")
-    if inventory_count >= 20:
-        achievements_to_unlock.append("buy_20")
-    
-    if item['type'] == 'weapon':
-        achievements_to_unlock.append("buy_weapon")
-    
-    if stats["total_coins_spent"] >= 1000:
-        achievements_to_unlock.append("spend_1000")
+    with span("purchase.inventory"):
+        inventory_item = PlayerInventory(player_id=purchase.player_id, item_id=purchase.item_id)
+        doc = inventory_item.model_dump()
+        doc['purchased_at'] = doc['purchased_at'].isoformat()
+        await store.insert_inventory_item(doc)
+        
+        inventory_count = await store.count_inventory(purchase.player_id)
     
-    for ach_id in achievements_to_unlock:
-        existing = await db.player_achievements.find_one({
-            "player_id": purchase.player_id,
-            "achievement_id": ach_id
+    with span("purchase.stats_update"):
+        stats = await store.get_stats(purchase.player_id)
+        if not stats:
+            stats = {"player_id": purchase.player_id, "total_coins_spent": 0}
+        
+        stats["total_coins_spent"] = stats.get("total_coins_spent", 0) + item['price']
+        stats["total_purchases"] = inventory_count
+        await store.set_stats(purchase.player_id, {
+            "total_coins_spent": stats["total_coins_spent"],
+            "total_purchases": inventory_count
+        })
+        
+        await store.append_event("item_purchased", purchase.player_id, {
+            "item_id": item['item_id'],
+            "price": item['price'],
+            "item_type": item['type'],
         })
-        if not existing:
-            pa = PlayerAchievement(player_id=purchase.player_id, achievement_id=ach_id, unlocked_at=datetime.now(timezone.utc))
-            doc = pa.model_dump()
-            doc['unlocked_at'] = doc['unlocked_at'].isoformat()
-            await db.player_achievements.insert_one(doc)
+    
+    with span("purchase.achievements") as step:
+        achievements_to_unlock = purchase_achievements(stats, player, item['type'])
+        await unlock_achievements(purchase.player_id, achievements_to_unlock)
+        if step:
+            step.attributes["unlocked"] = len(achievements_to_unlock)
+    invalidate_player_reads(purchase.player_id)
     
     return {"message": "Item purchased successfully", "item": item, "achievements_unlocked": len(achievements_to_unlock)}
 
 @api_router.get("/shop/inventory/{player_id}")
 async def get_player_inventory(player_id: str):
-    inventory = await db.player_inventory.find({"player_id": player_id}, {"_id": 0}).to_list(100)
+    inventory = await store.list_inventory(player_id)
     return inventory
 
 @api_router.get("/player/{player_id}/stats")
 async def get_player_stats(player_id: str):
-    stats = await db.player_stats.find_one({"player_id": player_id}, {"_id": 0})
+    stats = await single_flight.do(
+        ("player_stats", player_id),
+        lambda: store.get_stats(player_id)
+    )
     if not stats:
-        return {
-            "player_id": player_id,
-            "total_enemies_killed": 0,
-            "total_wins": 0,
-            "total_games": 0,
-            "total_score": 0,
-            "total_bullets_shot": 0,
-            "total_special_used": 0,
-            "total_coins_spent": 0,
-            "characters_played": [],
-            "maps_played": []
-        }
+        return empty_stats(player_id)
     return stats
 
+# ===== ADMIN: PROFILING =====
+@api_router.post("/admin/profiling", dependencies=[Depends(require_admin)])
+async def start_profiling(request: ProfilingRequest):
+    if profiler.session is not None:
+        raise HTTPException(status_code=409, detail="A profiling session is already running")
+    return profiler.start(request.routes, request.sample_rate, request.duration, request.allocations)
+
+@api_router.get("/admin/profiling", dependencies=[Depends(require_admin)])
+async def get_profiling_status():
+    return profiler.status()
+
+@api_router.delete("/admin/profiling", dependencies=[Depends(require_admin)])
+async def stop_profiling():
+    return await profiler.stop()
+
+# ===== METRICS =====
+@api_router.get("/metrics/admission")
+async def get_admission_metrics():
+    return admission.snapshot()
+
+@api_router.get("/metrics/matchmaking")
+async def get_matchmaking_metrics():
+    return matchmaker.snapshot()
+
+@api_router.get("/metrics/tracing")
+async def get_tracing_metrics():
+    return tracer.snapshot()
+
 # ===== MAPS =====
 @api_router.get("/maps")
 async def get_maps():
@@ -645,6 +861,15 @@ async def get_maps():
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(
+    ResponseEncodingMiddleware,
+    minimum_size=int(os.environ.get('RESPONSE_COMPRESSION_MIN_SIZE', 500)),
+)
+
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+app.add_middleware(TracingMiddleware, exporter=tracer)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -660,6 +885,30 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    await store.create_indexes()
+
+@app.on_event("startup")
+async def start_matchmaking():
+    matchmaker.start()
+
+@app.on_event("startup")
+async def start_trace_export():
+    tracer.start()
+
+@app.on_event("shutdown")
+async def stop_matchmaking():
+    await matchmaker.stop()
+
+@app.on_event("shutdown")
+async def stop_trace_export():
+    await tracer.stop()
+
+@app.on_event("shutdown")
+async def stop_profiling_session():
+    await profiler.stop()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
\ No newline at end of file
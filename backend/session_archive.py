@@ -0,0 +1,190 @@
+"""Cold storage for old game sessions.
+
+Sessions older than ``SESSION_ARCHIVE_MAX_AGE_DAYS`` are moved out of the
+``game_sessions`` collection into zstd-compressed Parquet files partitioned
+by month (``<SESSION_ARCHIVE_DIR>/month=YYYY-MM/part-<uuid>.parquet``).
+Only raw sessions are moved; ``player_stats`` and achievements are untouched.
+Replay metadata is stored as a JSON string; the replay files themselves stay
+where they are and remain downloadable, with ownership checked against the
+archived session.
+
+Each part is sorted by ``player_id`` and split into small row groups, so the
+min/max statistics Parquet keeps per row group let a player's read skip
+almost all of every file.
+
+Parts are written under a dot-prefixed temporary name, which dataset reads
+ignore, and renamed into place once complete, so a crash mid-write can't
+leave a truncated part that breaks every read. Players with archived
+sessions are flagged (``has_archived_sessions``) so session listings only
+open the archive for them.
+
+Run the job with ``python session_archive.py [max_age_days]``; archives
+written before the flag existed are covered by a one-off
+``python session_archive.py --mark-players``.
+"""
+import asyncio
+import json
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+from store import Store
+
+
+ROOT_DIR = Path(__file__).parent
+
+ARCHIVE_DIR = Path(os.environ.get('SESSION_ARCHIVE_DIR', ROOT_DIR / 'archive' / 'game_sessions'))
+ARCHIVE_MAX_AGE_DAYS = int(os.environ.get('SESSION_ARCHIVE_MAX_AGE_DAYS', 90))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('SESSION_ARCHIVE_BATCH_SIZE', 10000))
+ARCHIVE_ROW_GROUP_SIZE = int(os.environ.get('SESSION_ARCHIVE_ROW_GROUP_SIZE', 1000))
+
+ARCHIVE_SCHEMA = pa.schema([
+    ("session_id", pa.string()),
+    ("player_id", pa.string()),
+    ("character_id", pa.string()),
+    ("map_id", pa.string()),
+    ("score", pa.int64()),
+    ("enemies_defeated", pa.int64()),
+    ("victory", pa.bool_()),
+    ("xp_earned", pa.int64()),
+    ("coins_earned", pa.int64()),
+    ("duration", pa.int64()),
+    ("health_remaining", pa.int64()),
+    ("max_health", pa.int64()),
+    ("match_id", pa.string()),
+    ("replay", pa.string()),
+    ("created_at", pa.string()),
+])
+SESSION_COLUMNS = ARCHIVE_SCHEMA.names
+
+
+def _write_partitions(sessions: List[dict]) -> None:
+    df = pd.DataFrame(sessions, columns=SESSION_COLUMNS)
+    df['replay'] = df['replay'].map(lambda replay: json.dumps(replay) if isinstance(replay, dict) else None)
+    df['month'] = df['created_at'].str.slice(0, 7)
+    for month, part in df.groupby('month'):
+        month_dir = ARCHIVE_DIR / f"month={month}"
+        month_dir.mkdir(parents=True, exist_ok=True)
+        name = f"part-{uuid.uuid4().hex}.parquet"
+        tmp = month_dir / f".{name}.tmp"
+        part.drop(columns=['month']).sort_values('player_id', kind='stable').to_parquet(
+            tmp,
+            schema=ARCHIVE_SCHEMA,
+            compression='zstd',
+            row_group_size=ARCHIVE_ROW_GROUP_SIZE,
+            index=False,
+        )
+        os.replace(tmp, month_dir / name)
+
+
+async def archive_sessions(db, max_age_days: int = ARCHIVE_MAX_AGE_DAYS) -> int:
+    """Move sessions older than ``max_age_days`` to Parquet, one batch at a time.
+
+    Each batch is written to disk before it is deleted from Mongo, so a crash
+    can at worst leave a session in both places; reads de-duplicate on
+    ``session_id``, within the archive and against the hot collection.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=max_age_days)).isoformat()
+    query = {"created_at": {"$lt": cutoff}}
+    archived = 0
+
+    while True:
+        batch = await db.game_sessions.find(query, {"_id": 0}).sort("created_at", 1).to_list(ARCHIVE_BATCH_SIZE)
+        if not batch:
+            break
+        await asyncio.to_thread(_write_partitions, batch)
+        await Store(db).mark_archived_sessions(list({s['player_id'] for s in batch}))
+        await db.game_sessions.delete_many({"session_id": {"$in": [s['session_id'] for s in batch]}})
+        archived += len(batch)
+
+    return archived
+
+
+def _archive_exists() -> bool:
+    return ARCHIVE_DIR.exists() and any(ARCHIVE_DIR.iterdir())
+
+
+async def mark_archived_players(db) -> int:
+    """Flag every player that has sessions in the archive; returns how many."""
+    if not _archive_exists():
+        return 0
+    df = await asyncio.to_thread(pd.read_parquet, ARCHIVE_DIR, columns=["player_id"], schema=ARCHIVE_SCHEMA)
+    player_ids = df['player_id'].dropna().unique().tolist()
+    for i in range(0, len(player_ids), ARCHIVE_BATCH_SIZE):
+        await Store(db).mark_archived_sessions(player_ids[i:i + ARCHIVE_BATCH_SIZE])
+    return len(player_ids)
+
+
+def _read_player_sessions(player_id: str) -> pd.DataFrame:
+    # The explicit schema fills columns missing from older parts with nulls
+    df = pd.read_parquet(ARCHIVE_DIR, filters=[("player_id", "==", player_id)], schema=ARCHIVE_SCHEMA)
+    return df.drop_duplicates("session_id").sort_values("created_at", ascending=False)
+
+
+def read_archived_wins(player_ids: List[str], columns: List[str]) -> pd.DataFrame:
+    """Blocking read of ``columns`` for the given players' archived victories."""
+    if not _archive_exists():
+        return pd.DataFrame(columns=columns)
+    return pd.read_parquet(
+        ARCHIVE_DIR,
+        columns=columns,
+        filters=[("player_id", "in", player_ids), ("victory", "==", True)],
+        schema=ARCHIVE_SCHEMA,
+    )
+
+
+def _to_records(df: pd.DataFrame) -> List[dict]:
+    # Optional columns come back as NaN for sessions that didn't report them
+    sessions = df.astype(object).where(df.notna(), None).to_dict('records')
+    for session in sessions:
+        if session['replay'] is not None:
+            session['replay'] = json.loads(session['replay'])
+    return sessions
+
+
+async def read_archived_sessions(player_id: str, skip: int, limit: int, exclude: Iterable[str] = ()) -> List[dict]:
+    """Return a page of a player's archived sessions, newest first.
+
+    Sessions in ``exclude`` (those still in the hot collection) are left out
+    before paging.
+    """
+    if limit <= 0 or not _archive_exists():
+        return []
+    df = await asyncio.to_thread(_read_player_sessions, player_id)
+    exclude = set(exclude)
+    if exclude:
+        df = df[~df['session_id'].isin(exclude)]
+    return _to_records(df.iloc[skip:skip + limit])
+
+
+async def find_archived_session(session_id: str, player_id: Optional[str] = None) -> Optional[dict]:
+    """Look up a single archived session, optionally restricted to one player."""
+    if not _archive_exists():
+        return None
+    filters = [("session_id", "==", session_id)]
+    if player_id:
+        filters.append(("player_id", "==", player_id))
+    df = await asyncio.to_thread(pd.read_parquet, ARCHIVE_DIR, filters=filters, schema=ARCHIVE_SCHEMA)
+    sessions = _to_records(df.head(1))
+    return sessions[0] if sessions else None
+
+
+if __name__ == "__main__":
+    from server import client, db
+
+    if sys.argv[1:] == ["--mark-players"]:
+        count = asyncio.run(mark_archived_players(db))
+        client.close()
+        print(f"Flagged {count} players with archived sessions")
+        sys.exit()
+
+    max_age = int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_MAX_AGE_DAYS
+    count = asyncio.run(archive_sessions(db, max_age))
+    client.close()
+    print(f"Archived {count} sessions older than {max_age} days to {ARCHIVE_DIR}")
@@ -0,0 +1,38 @@
+"""Request coalescing for concurrent identical reads.
+
+``SingleFlight.do(key, fn)`` runs ``fn()`` once per key at a time: callers
+that arrive while a call is in flight await the same task instead of issuing
+their own query. Nothing is kept after the call completes, so results are
+never older than the in-flight query. Writers call ``forget`` so reads
+arriving after a write start a fresh query instead of joining an older one.
+"""
+import asyncio
+import copy
+import functools
+from typing import Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._done, key))
+        else:
+            self.shared += 1
+        # shield: a cancelled caller must not cancel the query other callers are waiting on.
+        # Every caller gets its own copy since handlers mutate the documents they return.
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def forget(self, *keys: Hashable):
+        for key in keys:
+            self._inflight.pop(key, None)
@@ -0,0 +1,296 @@
+"""Data access for every per-player collection.
+
+All documents owned by a player carry a player_id-prefixed ``_id``:
+
+    players, player_stats   <player_id>
+    game_sessions           <player_id>:<session_id>
+    player_inventory        <player_id>:<purchased_at>:<item_id>
+    player_achievements     <player_id>:<achievement_id>
+    player_challenges       <player_id>:<week>
+    game_events             <player_id>:<ObjectId hex>
+
+Each collection is meant to be sharded on ``{player_id: 1, _id: 1}`` (see
+``SHARD_KEYS``), so a player's documents live together and every query
+below names the player and is routed to a single shard. Since ``_id`` embeds
+the player, ``_id`` uniqueness also enforces the natural key (one
+achievement per player, one challenge document per week, ...), and
+re-running an insert is idempotent.
+
+Updates and upserts address a document by its full shard key (see
+``key_filter``), which sharded upserts require. Documents still on ObjectId
+``_id``s are therefore not matched by them, so ``cli.py migrate-keys`` must
+have run before this code serves traffic; a write that misses because its
+document is still on a legacy ``_id`` raises ``UnmigratedKeyError`` rather
+than silently doing nothing or inserting a duplicate.
+"""
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+
+# Collection -> fields joined (after player_id) into the document _id
+KEY_FIELDS: Dict[str, tuple] = {
+    "players": (),
+    "player_stats": (),
+    "game_sessions": ("session_id",),
+    "player_inventory": ("purchased_at", "item_id"),
+    "player_achievements": ("achievement_id",),
+    "player_challenges": ("week",),
+}
+
+PLAYER_COLLECTIONS = tuple(KEY_FIELDS) + ("game_events",)
+SHARD_KEYS = {name: {"player_id": 1, "_id": 1} for name in PLAYER_COLLECTIONS}
+
+DUPLICATE_KEY_ERROR = 11000
+
+# Documents written before the compound keys, still awaiting ``cli.py migrate-keys``
+LEGACY_ID_QUERY = {"_id": {"$type": "objectId"}}
+
+
+class UnmigratedKeyError(RuntimeError):
+    """A write missed its document because it still has an ObjectId ``_id``."""
+
+    def __init__(self, collection: str, player_id: str):
+        super().__init__(f"{collection} for player {player_id} still has ObjectId _ids; run cli.py migrate-keys first")
+
+
+def raise_unless_duplicate_keys(error: BulkWriteError):
+    """Re-raise ``error`` unless every write that failed did so on a duplicate key."""
+    if any(err["code"] != DUPLICATE_KEY_ERROR for err in error.details.get("writeErrors", [])):
+        raise error
+
+
+def player_key(player_id: str, *parts: str) -> str:
+    return ":".join((player_id,) + parts)
+
+
+def document_id(collection: str, doc: Dict) -> Optional[str]:
+    """Compound _id of ``doc``, or None for collections whose ids aren't derived from fields."""
+    if collection not in KEY_FIELDS:
+        return None
+    return player_key(doc["player_id"], *(str(doc[f]) for f in KEY_FIELDS[collection]))
+
+
+def event_id(player_id: str, oid: Optional[ObjectId] = None) -> str:
+    # ObjectId hex keeps a player's events in insertion order when sorted by _id
+    return player_key(player_id, str(oid or ObjectId()))
+
+
+def key_filter(player_id: str, *parts: str) -> Dict:
+    """Filter on the full shard key of the document keyed ``player_id:parts``."""
+    return {"player_id": player_id, "_id": player_key(player_id, *parts)}
+
+
+EVENT_TYPES = (
+    "player_created",
+    "player_snapshot",
+    "session_completed",
+    "item_purchased",
+    "xp_granted",
+    "coins_changed",
+    "achievement_unlocked",
+)
+
+
+def make_event(event_type: str, player_id: str, data: Dict) -> Dict:
+    assert event_type in EVENT_TYPES, event_type
+    return {
+        "_id": event_id(player_id),
+        "event_id": str(uuid.uuid4()),
+        "type": event_type,
+        "player_id": player_id,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "data": data,
+    }
+
+
+def _with_id(collection: str, doc: Dict) -> Dict:
+    return {"_id": document_id(collection, doc), **doc}
+
+
+class Store:
+    def __init__(self, db):
+        self.db = db
+
+    # ---------- players ----------
+
+    async def insert_player(self, doc: Dict):
+        await self.db.players.insert_one(_with_id("players", doc))
+
+    async def get_player(self, player_id: str, fields: Optional[List[str]] = None) -> Optional[Dict]:
+        projection = {"_id": 0, **{f: 1 for f in fields or ()}}
+        return await self.db.players.find_one({"player_id": player_id}, projection)
+
+    async def mark_archived_sessions(self, player_ids: List[str]):
+        await self.db.players.update_many({"player_id": {"$in": player_ids}}, {"$set": {"has_archived_sessions": True}})
+
+    async def has_archived_sessions(self, player_id: str) -> bool:
+        player = await self.get_player(player_id, ["has_archived_sessions"])
+        return bool(player and player.get("has_archived_sessions"))
+
+    async def update_player(self, player_id: str, update, return_document: bool = False) -> Optional[Dict]:
+        """Apply an update (document or pipeline); returns the updated player if asked to."""
+        if not return_document:
+            result = await self.db.players.update_one(key_filter(player_id), update)
+            if not result.matched_count:
+                await self._raise_if_unmigrated("players", player_id)
+            return None
+        player = await self.db.players.find_one_and_update(
+            key_filter(player_id),
+            update,
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if player is None:
+            await self._raise_if_unmigrated("players", player_id)
+        return player
+
+    # ---------- stats ----------
+
+    async def get_stats(self, player_id: str) -> Optional[Dict]:
+        return await self.db.player_stats.find_one({"player_id": player_id}, {"_id": 0})
+
+    async def set_stats(self, player_id: str, fields: Dict):
+        result = await self.db.player_stats.update_one(key_filter(player_id), {"$set": fields})
+        if not result.matched_count:
+            # Only upsert once we know there's no legacy document it would duplicate
+            await self._raise_if_unmigrated("player_stats", player_id)
+            await self.db.player_stats.update_one(key_filter(player_id), {"$set": fields}, upsert=True)
+
+    # ---------- game sessions ----------
+
+    async def insert_sessions(self, docs: List[Dict]):
+        await self.db.game_sessions.insert_many([_with_id("game_sessions", doc) for doc in docs])
+
+    async def get_session(self, player_id: str, session_id: str, fields: Optional[List[str]] = None) -> Optional[Dict]:
+        projection = {"_id": 0, **{f: 1 for f in fields or ()}}
+        return await self.db.game_sessions.find_one({"player_id": player_id, "session_id": session_id}, projection)
+
+    async def find_session_owner(self, session_id: str) -> Optional[str]:
+        """Resolve a bare session_id to its player; not shard-targeted, only for legacy routes."""
+        session = await self.db.game_sessions.find_one({"session_id": session_id}, {"_id": 0, "player_id": 1})
+        return session["player_id"] if session else None
+
+    async def update_session(self, player_id: str, session_id: str, fields: Dict):
+        result = await self.db.game_sessions.update_one(
+            key_filter(player_id, session_id),
+            {"$set": fields}
+        )
+        if not result.matched_count:
+            await self._raise_if_unmigrated("game_sessions", player_id, session_id=session_id)
+
+    async def count_sessions(self, player_id: str) -> int:
+        return await self.db.game_sessions.count_documents({"player_id": player_id})
+
+    async def list_session_ids(self, player_id: str) -> List[str]:
+        docs = await self.db.game_sessions.find({"player_id": player_id}, {"_id": 0, "session_id": 1}).to_list(None)
+        return [doc["session_id"] for doc in docs]
+
+    async def list_sessions(self, player_id: str, skip: int, limit: int) -> List[Dict]:
+        return await self.db.game_sessions.find(
+            {"player_id": player_id}, {"_id": 0}
+        ).sort("created_at", -1).skip(skip).to_list(limit)
+
+    # ---------- achievements ----------
+
+    async def has_achievement(self, player_id: str, achievement_id: str) -> bool:
+        doc = await self.db.player_achievements.find_one(
+            {"player_id": player_id, "achievement_id": achievement_id}, {"_id": 1}
+        )
+        return doc is not None
+
+    async def list_achievements(self, player_id: str, limit: int = 100) -> List[Dict]:
+        return await self.db.player_achievements.find({"player_id": player_id}, {"_id": 0}).to_list(limit)
+
+    async def insert_achievements(self, player_id: str, achievement_ids: List[str]) -> List[str]:
+        """Upsert the achievements in one bulk write; returns the ids that were newly unlocked."""
+        if not achievement_ids:
+            return []
+        unlocked_at = datetime.now(timezone.utc).isoformat()
+        ops = [
+            UpdateOne(
+                key_filter(player_id, ach_id),
+                {"$setOnInsert": {
+                    "achievement_id": ach_id,
+                    "unlocked_at": unlocked_at,
+                }},
+                upsert=True,
+            )
+            for ach_id in dict.fromkeys(achievement_ids)
+        ]
+        try:
+            result = await self.db.player_achievements.bulk_write(ops, ordered=False)
+            upserted = result.upserted_ids.values()
+        except BulkWriteError as e:
+            # A concurrent unlock of the same achievement loses the race on _id; anything else is real
+            raise_unless_duplicate_keys(e)
+            upserted = [u["_id"] for u in e.details.get("upserted", [])]
+        return [key.split(":", 1)[1] for key in upserted]
+
+    # ---------- inventory ----------
+
+    async def insert_inventory_item(self, doc: Dict):
+        await self.db.player_inventory.insert_one(_with_id("player_inventory", doc))
+
+    async def count_inventory(self, player_id: str) -> int:
+        return await self.db.player_inventory.count_documents({"player_id": player_id})
+
+    async def count_inventory_by_player(self, player_ids: List[str]) -> Dict[str, int]:
+        rows = await self.db.player_inventory.aggregate([
+            {"$match": {"player_id": {"$in": player_ids}}},
+            {"$group": {"_id": "$player_id", "count": {"$sum": 1}}},
+        ]).to_list(None)
+        return {row["_id"]: row["count"] for row in rows}
+
+    async def list_inventory(self, player_id: str, limit: int = 100) -> List[Dict]:
+        return await self.db.player_inventory.find({"player_id": player_id}, {"_id": 0}).to_list(limit)
+
+    # ---------- challenges ----------
+
+    async def get_challenge_progress(self, player_id: str, week: str) -> Optional[Dict]:
+        return await self.db.player_challenges.find_one({"player_id": player_id, "week": week}, {"_id": 0})
+
+    async def add_challenge_progress(self, player_id: str, week: str, increments: Dict[str, int]) -> Dict:
+        update = {"$inc": increments, "$setOnInsert": {"week": week}}
+        progress = await self.db.player_challenges.find_one_and_update(
+            key_filter(player_id, week), update, projection={"_id": 0}, return_document=ReturnDocument.AFTER
+        )
+        if progress is None:
+            await self._raise_if_unmigrated("player_challenges", player_id, week=week)
+            progress = await self.db.player_challenges.find_one_and_update(
+                key_filter(player_id, week), update, projection={"_id": 0}, upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        return progress
+
+    # ---------- events ----------
+
+    async def append_events(self, events: List[Dict]):
+        """Append events built with ``make_event`` to the ``game_events`` log."""
+        if events:
+            await self.db.game_events.insert_many(events, ordered=False)
+
+    async def append_event(self, event_type: str, player_id: str, data: Dict):
+        await self.append_events([make_event(event_type, player_id, data)])
+
+    # ---------- legacy keys ----------
+
+    async def _raise_if_unmigrated(self, collection: str, player_id: str, **fields):
+        """Called when a write by shard key matched nothing: fail if a legacy document was the target."""
+        legacy = await self.db[collection].find_one({"player_id": player_id, **fields, **LEGACY_ID_QUERY}, {"_id": 1})
+        if legacy:
+            raise UnmigratedKeyError(collection, player_id)
+
+    # ---------- indexes ----------
+
+    async def create_indexes(self):
+        for name in PLAYER_COLLECTIONS:
+            await self.db[name].create_index([("player_id", 1), ("_id", 1)])
+        await self.db.game_sessions.create_index([("player_id", 1), ("created_at", -1)])
+        await self.db.game_sessions.create_index("created_at")
+        await self.db.game_sessions.create_index("session_id")
+        await self.db.player_achievements.create_index([("player_id", 1), ("achievement_id", 1)])
@@ -0,0 +1,295 @@
+"""Lightweight request tracing for the /api routes.
+
+``TracingMiddleware`` opens a root span for every request and keeps the
+active span in a context variable. Route code adds spans for its internal
+steps with ``span("name")``, and ``MongoCommandTracer`` (a pymongo command
+listener) records one span per Mongo command under whatever span issued it.
+Motor runs pymongo on an executor with a copy of the caller's context, so
+command spans land under the right step.
+
+Finished traces go to a ``TraceExporter``:
+
+* requests slower than ``slow_ms`` have their span tree logged and are
+  always exported;
+* other requests are exported with probability ``sample_rate``.
+
+Exported traces are appended to ``path`` as OTLP/JSON lines (one
+``ExportTraceServiceRequest`` per flush), the format written by the
+OpenTelemetry collector's file exporter, so they can be loaded into any
+OTLP-compatible viewer.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "battle-arena-backend"
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "pending")
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List["Span"] = []
+        # In-flight Mongo commands, keyed by (connection_id, request_id)
+        self.pending: Dict[Tuple, Tuple] = {}
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], attributes: Dict, start_ns: Optional[int] = None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error = False
+
+    def end(self, end_ns: Optional[int] = None):
+        self.end_ns = end_ns or time.time_ns()
+        self.trace.spans.append(self)
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_otlp(self) -> Dict:
+        return {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": 2 if self.parent_id is None else 1,  # SERVER / INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2 if self.error else 1},
+        }
+
+
+def _otlp_attribute(key: str, value) -> Dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.trace.trace_id if current else None
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Record ``name`` as a child of the active span; a no-op outside a traced request."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException:
+        child.error = True
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+
+# ==================== MONGO COMMANDS ====================
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """pymongo listener that turns each command into a span of the active trace."""
+
+    def started(self, event):
+        parent = _current_span.get()
+        if parent is None:
+            return
+        name = event.command_name
+        target = event.command.get("collection" if name == "getMore" else name)
+        parent.trace.pending[(event.connection_id, event.request_id)] = (
+            parent.span_id, name, target if isinstance(target, str) else None, time.time_ns()
+        )
+
+    def _finish(self, event, error: bool):
+        parent = _current_span.get()
+        if parent is None:
+            return
+        pending = parent.trace.pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        parent_id, name, collection, start_ns = pending
+        attributes = {"db.system": "mongodb", "db.operation": name}
+        if collection:
+            attributes["db.mongodb.collection"] = collection
+        command_span = Span(parent.trace, f"mongo.{name}", parent_id, attributes, start_ns)
+        command_span.error = error
+        command_span.end()
+
+    def succeeded(self, event):
+        self._finish(event, error=False)
+
+    def failed(self, event):
+        self._finish(event, error=True)
+
+
+# ==================== EXPORT ====================
+
+def format_span_tree(spans: List[Span]) -> str:
+    children: Dict[Optional[str], List[Span]] = {}
+    for s in sorted(spans, key=lambda s: s.start_ns):
+        children.setdefault(s.parent_id, []).append(s)
+    lines = []
+
+    def walk(parent_id: Optional[str], depth: int):
+        for s in children.get(parent_id, []):
+            attrs = " ".join(f"{k}={v}" for k, v in s.attributes.items())
+            lines.append(f"{'  ' * depth}{s.name} {s.duration_ms:.1f}ms{' ERROR' if s.error else ''} {attrs}".rstrip())
+            walk(s.span_id, depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+class TraceExporter:
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        sample_rate: float = 0.0,
+        slow_ms: float = 500.0,
+        flush_interval: float = 5.0,
+        max_buffered: int = 10000,
+    ):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.flush_interval = flush_interval
+        self._buffer: Deque[Span] = deque(maxlen=max_buffered)
+        self._task: Optional[asyncio.Task] = None
+        self.traces = 0
+        self.slow_traces = 0
+        self.exported_traces = 0
+
+    def finish(self, root: Span):
+        self.traces += 1
+        slow = root.duration_ms >= self.slow_ms
+        if slow:
+            self.slow_traces += 1
+            logger.warning(
+                "Slow request %s %.1fms (trace %s)\n%s",
+                root.name, root.duration_ms, root.trace.trace_id, format_span_tree(root.trace.spans),
+            )
+        if self.path is not None and (slow or random.random() < self.sample_rate):
+            self.exported_traces += 1
+            self._buffer.extend(root.trace.spans)
+
+    def _write(self, spans: List[Span]):
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [s.to_otlp() for s in spans]}],
+        }]}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(payload, separators=(",", ":")) + "\n")
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        spans = list(self._buffer)
+        self._buffer.clear()
+        await asyncio.to_thread(self._write, spans)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Trace export failed")
+
+    def start(self):
+        if self._task is None and self.path is not None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def snapshot(self) -> Dict:
+        return {
+            "traces": self.traces,
+            "slow_traces": self.slow_traces,
+            "exported_traces": self.exported_traces,
+            "buffered_spans": len(self._buffer),
+        }
+
+
+# ==================== MIDDLEWARE ====================
+
+class TracingMiddleware:
+    def __init__(self, app, exporter: TraceExporter, prefix: str = "/api"):
+        self.app = app
+        self.exporter = exporter
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        root = Span(Trace(), f"{scope['method']} {scope['path']}", None, {
+            "http.method": scope["method"],
+            "http.target": scope["path"],
+        })
+        token = _current_span.set(root)
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+                root.error = message["status"] >= 500
+                MutableHeaders(scope=message).append("X-Trace-Id", root.trace.trace_id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except BaseException:
+            root.error = True
+            raise
+        finally:
+            _current_span.reset(token)
+            endpoint = scope.get("endpoint")
+            if endpoint is not None:
+                root.attributes["http.route"] = endpoint.__name__
+                root.name = f"{scope['method']} {endpoint.__name__}"
+            root.end()
+            self.exporter.finish(root)
@@ -96,7 +96,7 @@ export const GameProvider = ({ children }) => {
 
   const completeGameSession = async (sessionId, gameData) => {
     try {
-      const response = await axios.put(`${API}/game/session/${sessionId}`, gameData);
+      const response = await axios.put(`${API}/players/${player.player_id}/sessions/${sessionId}`, gameData);
       await refreshPlayer();
       return response.data;
     } catch (error) {
@@ -105,6 +105,16 @@ export const GameProvider = ({ children }) => {
     }
   };
 
+  const uploadReplay = async (sessionId, replay) => {
+    try {
+      await axios.put(`${API}/players/${player.player_id}/sessions/${sessionId}/replay`, replay, {
+        headers: { 'Content-Type': 'application/octet-stream' }
+      });
+    } catch (error) {
+      console.error('Error uploading replay:', error);
+    }
+  };
+
   const getAchievements = async () => {
     try {
       const response = await axios.get(`${API}/achievements/${player.player_id}`);
@@ -165,6 +175,7 @@ export const GameProvider = ({ children }) => {
     getMaps,
     createGameSession,
     completeGameSession,
+    uploadReplay,
     getAchievements,
     unlockAchievement,
     getShopItems,
@@ -2,11 +2,35 @@ import React, { useEffect, useRef, useState } from 'react';
 import { useNavigate, useLocation } from 'react-router-dom';
 import { useGame } from '../context/GameContext';
 
+// Replay format, see backend/replays.py
+const REPLAY_HEADER_SIZE = 10;
+const REPLAY_FRAME_SIZE = 7;
+const REPLAY_VERSION = 1;
+const BUTTON_SHOT = 1 << 4;
+const BUTTON_SPECIAL = 1 << 5;
+
+const encodeReplay = (frames, width, height) => {
+  const buffer = new ArrayBuffer(REPLAY_HEADER_SIZE + frames.length * REPLAY_FRAME_SIZE);
+  const view = new DataView(buffer);
+  'MRPL'.split('').forEach((c, i) => view.setUint8(i, c.charCodeAt(0)));
+  view.setUint8(4, REPLAY_VERSION);
+  view.setUint16(6, width, true);
+  view.setUint16(8, height, true);
+  frames.forEach(([dt, buttons, x, y], i) => {
+    const offset = REPLAY_HEADER_SIZE + i * REPLAY_FRAME_SIZE;
+    view.setUint16(offset, dt, true);
+    view.setUint8(offset + 2, buttons);
+    view.setUint16(offset + 3, x, true);
+    view.setUint16(offset + 5, y, true);
+  });
+  return buffer;
+};
+
 export const GameArena = () => {
   const navigate = useNavigate();
   const location = useLocation();
   const canvasRef = useRef(null);
-  const { player, createGameSession, completeGameSession } = useGame();
+  const { player, createGameSession, completeGameSession, uploadReplay } = useGame();
   
   const character = location.state?.character;
   const map = location.state?.map;
@@ -30,7 +54,9 @@ export const GameArena = () => {
     lastTime: 0,
     startTime: Date.now(),
     bulletsShot: 0,
-    specialUsed: 0
+    specialUsed: 0,
+    replayFrames: [],
+    frameButtons: 0
   });
 
   useEffect(() => {
@@ -132,6 +158,7 @@ export const GameArena = () => {
     });
     
     gameDataRef.current.bulletsShot++;
+    gameDataRef.current.frameButtons |= BUTTON_SHOT;
   };
 
   const useSpecialAbility = () => {
@@ -150,6 +177,7 @@ export const GameArena = () => {
     });
     
     gameDataRef.current.specialUsed++;
+    gameDataRef.current.frameButtons |= BUTTON_SPECIAL;
   };
 
   const spawnEnemies = () => {
@@ -207,6 +235,22 @@ export const GameArena = () => {
     }
   };
 
+  const recordFrame = (deltaTime, keys, p) => {
+    const canvas = canvasRef.current;
+    const buttons = gameDataRef.current.frameButtons
+      | ((keys['w'] || keys['arrowup']) ? 1 : 0)
+      | ((keys['s'] || keys['arrowdown']) ? 2 : 0)
+      | ((keys['a'] || keys['arrowleft']) ? 4 : 0)
+      | ((keys['d'] || keys['arrowright']) ? 8 : 0);
+    gameDataRef.current.replayFrames.push([
+      Math.min(0xffff, Math.max(0, Math.round(deltaTime))),
+      buttons,
+      Math.min(canvas.width, Math.max(0, Math.round(p.mouseX))),
+      Math.min(canvas.height, Math.max(0, Math.round(p.mouseY)))
+    ]);
+    gameDataRef.current.frameButtons = 0;
+  };
+
   const update = (deltaTime) => {
     const canvas = canvasRef.current;
     const p = gameDataRef.current.player;
@@ -220,6 +264,8 @@ export const GameArena = () => {
     p.x = Math.max(p.width / 2, Math.min(canvas.width - p.width / 2, p.x));
     p.y = Math.max(p.height / 2, Math.min(canvas.height - p.height / 2, p.y));
 
+    recordFrame(deltaTime, keys, p);
+
     gameDataRef.current.bullets = gameDataRef.current.bullets.filter(bullet => {
       bullet.x += bullet.vx;
       bullet.y += bullet.vy;
@@ -383,8 +429,16 @@ export const GameArena = () => {
         victory,
         duration,
         bullets_shot: gameDataRef.current.bulletsShot,
-        special_used: gameDataRef.current.specialUsed
+        special_used: gameDataRef.current.specialUsed,
+        health_remaining: Math.max(0, Math.floor(gameDataRef.current.player.health)),
+        max_health: gameDataRef.current.player.maxHealth
       });
+
+      const canvas = canvasRef.current;
+      uploadReplay(
+        gameDataRef.current.sessionId,
+        encodeReplay(gameDataRef.current.replayFrames, canvas.width, canvas.height)
+      );
       
       setTimeout(() => {
         navigate('/game-over', {
@@ -0,0 +1,76 @@
+import asyncio
+import random
+
+import pytest
+
+import session_archive
+from achievement_backfill import _load_rows
+from progression import session_result_achievements, win_achievements
+from session_archive import _write_partitions
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+@pytest.fixture(autouse=True)
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_archive, "ARCHIVE_DIR", tmp_path / "game_sessions")
+
+
+def _sessions(count, seed=1):
+    """Sessions with every mix of missing duration and health fields the rules handle."""
+    rnd = random.Random(seed)
+    sessions = []
+    for i in range(count):
+        session = {
+            "session_id": f"s{i}",
+            "player_id": f"p{rnd.randint(0, 9)}",
+            "character_id": rnd.choice(["gato", "jhon", "thisand"]),
+            "map_id": "roblox",
+            "victory": rnd.random() < 0.6,
+            "created_at": f"2025-0{rnd.randint(1, 9)}-01T00:00:00+00:00",
+        }
+        if rnd.random() < 0.8:
+            session["duration"] = rnd.randint(30, 200)
+        r = rnd.random()
+        if r < 0.3:
+            session["health_remaining"], session["max_health"] = rnd.randint(0, 120), 120
+        elif r < 0.4:
+            session["health_remaining"], session["max_health"] = 5, 0
+        sessions.append(session)
+    return sessions
+
+
+def _earned(wins):
+    return {ach for win in wins for ach in win_achievements(win["character_id"], win["speed"], win["perfect"], win["survivor"])}
+
+
+def _load(hot, players):
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        if hot:
+            await db.game_sessions.insert_many([dict(s) for s in hot])
+        return await _load_rows(db, players)
+
+    return {player["player_id"]: wins for player, _, wins, _ in asyncio.run(run())}
+
+
+def test_win_summary_covers_hot_and_archived_sessions():
+    sessions = _sessions(400)
+    hot, archived = sessions[::2], sessions[1::2]
+    _write_partitions(archived)
+    players = [{"player_id": f"p{i}", "has_archived_sessions": True} for i in range(10)]
+
+    wins = _load(hot, players)
+
+    for player in players:
+        player_id = player["player_id"]
+        expected = {ach for s in sessions if s["player_id"] == player_id for ach in session_result_achievements(s)}
+        assert _earned(wins[player_id]) == expected, player_id
+
+
+def test_archive_is_only_read_for_flagged_players():
+    _write_partitions([{**_sessions(1)[0], "player_id": "p", "victory": True, "duration": 10}])
+
+    wins = _load([], [{"player_id": "p"}, {"player_id": "q", "has_archived_sessions": True}])
+
+    assert wins == {"p": [], "q": []}
@@ -0,0 +1,119 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import admission
+from admission import AdmissionController, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace admission's monotonic clock with one the test advances by hand."""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(admission, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_token_bucket_bursts_then_refills(clock):
+    bucket = TokenBucket(burst=2)
+    assert bucket.take(rate=4, burst=2) == 0
+    assert bucket.take(rate=4, burst=2) == 0
+    assert bucket.take(rate=4, burst=2) == pytest.approx(0.25)
+
+    clock.now += 0.25
+    assert bucket.take(rate=4, burst=2) == 0
+
+    # Refill is capped at the burst size
+    clock.now += 60
+    assert [bucket.take(rate=4, burst=2) for _ in range(3)][-1] > 0
+
+
+def test_rate_limit_is_per_key(clock):
+    controller = AdmissionController(rate=1, burst=1)
+    controller.check_rate("a")
+    controller.check_rate("b")
+
+    with pytest.raises(HTTPException) as e:
+        controller.check_rate("a")
+    assert e.value.status_code == 429
+    assert e.value.headers == {"Retry-After": "1"}
+    assert controller.counters["rate_limited"] == 1
+
+    clock.now += 1
+    controller.check_rate("a")
+
+
+def test_least_recently_seen_buckets_are_evicted(clock):
+    controller = AdmissionController(rate=1, burst=10, max_buckets=2)
+    for key in ("a", "b", "a", "c"):
+        controller.check_rate(key)
+    assert list(controller._buckets) == ["a", "c"]
+
+
+async def _hold(controller, release, key=None):
+    async with controller.admit(key):
+        await release.wait()
+
+
+def test_sheds_when_queue_is_full():
+    async def run():
+        controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+        release = asyncio.Event()
+        holders = [asyncio.ensure_future(_hold(controller, release)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert controller.snapshot()["active"] == 1 and controller.snapshot()["waiting"] == 1
+
+        with pytest.raises(HTTPException) as e:
+            async with controller.admit():
+                pass
+        release.set()
+        await asyncio.gather(*holders)
+        return controller, e.value
+
+    controller, error = asyncio.run(run())
+    assert error.status_code == 503
+    assert controller.counters["shed_queue_full"] == 1
+    assert controller.counters["admitted"] == 2
+    assert controller.snapshot()["active"] == 0 and controller.snapshot()["waiting"] == 0
+
+
+def test_sheds_after_queue_timeout():
+    async def run():
+        controller = AdmissionController(max_concurrency=1, max_queue=5, queue_timeout=0.01)
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0)
+
+        with pytest.raises(HTTPException) as e:
+            async with controller.admit():
+                pass
+        release.set()
+        await holder
+        return controller, e.value
+
+    controller, error = asyncio.run(run())
+    assert error.status_code == 503
+    assert controller.counters["queued"] == 1
+    assert controller.counters["shed_queue_timeout"] == 1
+    assert controller.snapshot()["waiting"] == 0
+
+
+def test_queued_request_gets_released_slot():
+    async def run():
+        controller = AdmissionController(max_concurrency=1, max_queue=5, queue_timeout=5)
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0)
+        assert controller.snapshot()["waiting"] == 1
+        release.set()
+        await asyncio.gather(holder, waiter)
+        return controller
+
+    controller = asyncio.run(run())
+    assert controller.counters["queued"] == 1
+    assert controller.counters["admitted"] == 2
+    assert controller.snapshot()["active"] == 0
@@ -0,0 +1,80 @@
+from datetime import date
+
+from challenges import ChallengeSet, week_key
+
+DAY = date(2026, 10, 19)
+
+
+def _doc(progress):
+    """player_challenges document holding ``progress`` keyed by update field path."""
+    doc = {}
+    for field, value in progress.items():
+        *parents, leaf = field.split(".")
+        node = doc
+        for key in parents:
+            node = node.setdefault(key, {})
+        node[leaf] = value
+    return doc
+
+
+def _session(challenge, **fields):
+    return {
+        "character_id": challenge.character_id or "gato",
+        "map_id": challenge.map_id or "roblox",
+        "victory": True,
+        "score": 10,
+        "enemies_defeated": 1,
+        **fields,
+    }
+
+
+def test_selection_is_deterministic_per_period():
+    a, b = ChallengeSet(DAY), ChallengeSet(DAY)
+    assert [c.challenge_id for c in a.challenges] == [c.challenge_id for c in b.challenges]
+    assert a.week_key == week_key(DAY) == "2026-W43"
+    same_week = ChallengeSet(date(2026, 10, 21))
+    assert [c.challenge_id for c in same_week.weekly] == [c.challenge_id for c in a.weekly]
+
+
+def test_increments_cover_matching_challenges():
+    challenges = ChallengeSet(DAY)
+    for challenge in challenges.challenges:
+        session = _session(challenge)
+        increments = challenges.increments(session)
+        assert increments[challenges.field(challenge)] == challenge.amount(session)
+
+
+def test_increments_skip_losses_for_win_challenges():
+    challenges = ChallengeSet(DAY)
+    for challenge in challenges.challenges:
+        if challenge.metric == "wins":
+            assert challenges.field(challenge) not in challenges.increments(_session(challenge, victory=False))
+
+
+def test_newly_completed_only_when_crossing_target():
+    challenges = ChallengeSet(DAY)
+    for challenge in challenges.challenges:
+        field = challenges.field(challenge)
+        increments = {field: 1}
+        below = _doc({field: challenge.target - 1})
+        reached = _doc({field: challenge.target})
+        beyond = _doc({field: challenge.target + 1})
+        assert challenge not in challenges.newly_completed(below, increments)
+        assert challenge in challenges.newly_completed(reached, increments)
+        assert challenge not in challenges.newly_completed(beyond, increments)
+        # A large increment that jumps past the target still counts once
+        assert challenge in challenges.newly_completed(beyond, {field: challenge.target + 1})
+
+
+def test_newly_completed_ignores_challenges_not_incremented():
+    challenges = ChallengeSet(DAY)
+    doc = _doc({challenges.field(c): c.target for c in challenges.challenges})
+    assert challenges.newly_completed(doc, {}) == []
+
+
+def test_daily_progress_resets_with_the_day():
+    today, tomorrow = ChallengeSet(DAY), ChallengeSet(date(2026, 10, 20))
+    daily = today.daily[0]
+    doc = _doc({today.field(daily): daily.target})
+    assert today.progress_of(doc, daily) == daily.target
+    assert tomorrow.progress_of(doc, daily) == 0
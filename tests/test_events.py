@@ -0,0 +1,175 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+from events import PlayerProjection, rebuild_all, rebuild_player
+from progression import STARTING_COINS
+from store import make_event, player_key
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def _event(event_type, data, player_id="p"):
+    return make_event(event_type, player_id, data)
+
+
+def _win(**fields):
+    return {
+        "session_id": "s", "character_id": "gato", "map_id": "roblox", "score": 100,
+        "enemies_defeated": 7, "victory": True, "duration": 200, "bullets_shot": 40, **fields,
+    }
+
+
+def _project(*events):
+    projection = PlayerProjection("p")
+    for event in events:
+        projection.apply(event)
+    return projection
+
+
+def _db():
+    return mongomock_motor.AsyncMongoMockClient()["test"]
+
+
+async def _state(db, player_id):
+    player = await db.players.find_one({"player_id": player_id}, {"_id": 0})
+    stats = await db.player_stats.find_one({"player_id": player_id}, {"_id": 0})
+    achievements = await db.player_achievements.find({"player_id": player_id}, {"_id": 0, "achievement_id": 1}).to_list(None)
+    return player, stats, sorted(a["achievement_id"] for a in achievements)
+
+
+def test_projection_folds_events():
+    projection = _project(
+        _event("player_created", {"coins": STARTING_COINS}),
+        _event("xp_granted", {"xp": 150}),
+        _event("coins_changed", {"amount": -30}),
+        _event("session_completed", _win()),
+        _event("item_purchased", {"item_id": "shield", "price": 300, "item_type": "equipment"}),
+    )
+
+    assert projection.has_baseline
+    assert projection.total_xp == 150
+    assert projection.coins == STARTING_COINS - 30
+    assert projection.stats["total_wins"] == 1 and projection.stats["total_enemies_killed"] == 7
+    assert projection.stats["total_coins_spent"] == 300 and projection.stats["total_purchases"] == 1
+    assert {"first_win", "first_blood", "first_purchase"} <= set(projection.achievements)
+
+
+def test_snapshot_overrides_earlier_events():
+    projection = _project(
+        _event("xp_granted", {"xp": 999}),
+        _event("session_completed", _win()),
+        _event("player_snapshot", {
+            "total_xp": 40, "coins": 7, "stats": {"total_games": 12}, "achievements": {"kill_5": "2025-01-01"},
+        }),
+        _event("xp_granted", {"xp": 10}),
+    )
+
+    assert projection.total_xp == 50
+    assert projection.coins == 7
+    assert projection.stats["total_games"] == 12 and projection.stats["total_wins"] == 0
+    assert projection.achievements == {"kill_5": "2025-01-01"}
+
+
+def test_replays_manual_and_backfilled_unlocks_only():
+    projection = _project(
+        _event("player_created", {}),
+        _event("achievement_unlocked", {"achievement_id": "henryshop_visit", "source": "manual"}),
+        _event("achievement_unlocked", {"achievement_id": "gato_win", "source": "backfill"}),
+        # Rule unlocks are re-derived from the events that earned them
+        _event("achievement_unlocked", {"achievement_id": "first_win", "source": "rules"}),
+    )
+
+    assert set(projection.achievements) == {"henryshop_visit", "gato_win"}
+
+
+def test_player_without_baseline_is_not_rebuilt():
+    assert not _project(_event("xp_granted", {"xp": 10})).has_baseline
+
+
+def test_rebuild_player_rewrites_projections():
+    async def run():
+        db = _db()
+        await db.players.insert_one({"_id": player_key("p"), "player_id": "p", "level": 9, "coins": 0})
+        await db.player_stats.insert_one({"_id": player_key("p"), "player_id": "p", "total_wins": 50, "legacy_counter": 3})
+        await db.player_achievements.insert_many([
+            {"_id": player_key("p", "kill_100"), "player_id": "p", "achievement_id": "kill_100"},
+            {"_id": player_key("p", "first_win"), "player_id": "p", "achievement_id": "first_win", "unlocked_at": "kept"},
+        ])
+        await db.game_events.insert_many([
+            _event("player_created", {"coins": STARTING_COINS}),
+            _event("session_completed", _win()),
+            _event("achievement_unlocked", {"achievement_id": "henryshop_visit", "source": "manual"}),
+        ])
+        await rebuild_player(db, "p")
+        return await _state(db, "p"), await db.player_achievements.find_one({"achievement_id": "first_win"})
+
+    (player, stats, achievements), first_win = asyncio.run(run())
+    assert player["level"] == 1 and player["coins"] == STARTING_COINS
+    assert stats["total_wins"] == 1 and "legacy_counter" not in stats
+    assert "kill_100" not in achievements
+    assert {"first_win", "first_blood", "henryshop_visit"} <= set(achievements)
+    # Existing unlocks keep their original time
+    assert first_win["unlocked_at"] == "kept"
+
+
+def test_rebuild_all_batches_players_and_skips_missing_baselines():
+    async def run():
+        db = _db()
+        for pid in ("a", "b", "c"):
+            await db.players.insert_one({"_id": player_key(pid), "player_id": pid, "coins": 0})
+        await db.game_events.insert_many([
+            _event("player_created", {"coins": 5}, "a"),
+            _event("player_created", {"coins": 6}, "b"),
+            _event("xp_granted", {"xp": 10}, "c"),
+        ])
+        counts = await rebuild_all(db, batch_size=1)
+        coins = {p["player_id"]: p["coins"] async for p in db.players.find({})}
+        return counts, coins
+
+    counts, coins = asyncio.run(run())
+    assert counts == {"events": 3, "rebuilt": 2, "skipped": 1}
+    assert coins == {"a": 5, "b": 6, "c": 0}
+
+
+def test_rebuild_refuses_unmigrated_log():
+    async def run():
+        db = _db()
+        await db.game_events.insert_one({**_event("player_created", {}), "_id": ObjectId()})
+        await rebuild_player(db, "p")
+
+    with pytest.raises(RuntimeError, match="migrate-keys"):
+        asyncio.run(run())
+
+
+def test_rebuild_matches_live_flow(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import server
+    from store import Store
+
+    db = _db()
+    monkeypatch.setattr(server, "store", Store(db))
+    client = TestClient(server.app)
+
+    pid = client.post("/api/players", json={"username": "a"}).json()["player_id"]
+    for _ in range(3):
+        session = client.post("/api/game/session", json={"player_id": pid, "character_id": "gato", "map_id": "roblox"}).json()
+        client.put(f"/api/game/session/{session['session_id']}", json={
+            "score": 100, "enemies_defeated": 7, "victory": True, "duration": 50, "bullets_shot": 40,
+        }).raise_for_status()
+    client.post("/api/shop/purchase", json={"player_id": pid, "item_id": "diamond_sword"}).raise_for_status()
+    client.post(f"/api/achievements/{pid}/henryshop_visit").raise_for_status()
+
+    async def rebuild():
+        live = await _state(db, pid)
+        await db.players.update_one({"player_id": pid}, {"$set": {"coins": 0, "level": 1}})
+        await db.player_stats.update_one({"player_id": pid}, {"$set": {"total_wins": 0}})
+        await db.player_achievements.delete_many({"player_id": pid})
+        await rebuild_player(db, pid)
+        return live, await _state(db, pid)
+
+    live, rebuilt = asyncio.run(rebuild())
+    assert live[2]
+    assert rebuilt == live
@@ -0,0 +1,145 @@
+import asyncio
+
+from matchmaking import Matchmaker
+
+
+class FakeMatches:
+    """create_match stand-in recording pairs; can be told to fail or to wait."""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.pairs = []
+        self.release = None
+
+    async def __call__(self, a, b, match_id):
+        if self.release is not None:
+            await self.release.wait()
+        if self.fail:
+            raise RuntimeError("database down")
+        self.pairs.append({a.player_id, b.player_id})
+        return {a.player_id: f"s-{a.player_id}", b.player_id: f"s-{b.player_id}"}
+
+
+def _matchmaker(create_match, **kwargs):
+    kwargs = {"base_window": 2, "widen_per_second": 0, **kwargs}
+    return Matchmaker(create_match, **kwargs)
+
+
+def test_tick_pairs_closest_level_on_same_map():
+    matches = FakeMatches()
+    mm = _matchmaker(matches)
+    mm.enqueue("a", "gato", "roblox", 10)
+    mm.enqueue("far", "gato", "roblox", 13)
+    mm.enqueue("b", "jhon", "roblox", 11)
+    mm.enqueue("other_map", "jhon", "discord", 10)
+
+    asyncio.run(mm.tick())
+
+    assert matches.pairs == [{"a", "b"}]
+    a = mm.status("a")
+    assert a.status == "matched"
+    assert a.match["opponent_id"] == "b" and a.match["session_id"] == "s-a"
+    assert mm.status("far").status == "queued"
+    assert mm.status("other_map").status == "queued"
+
+
+def test_window_widens_with_wait():
+    mm = _matchmaker(FakeMatches(), base_window=2, widen_per_second=1, max_window=5)
+    ticket = mm.enqueue("a", "gato", "roblox", 10)
+    assert mm.window(ticket, ticket.enqueued_at) == 2
+    assert mm.window(ticket, ticket.enqueued_at + 2) == 4
+    assert mm.window(ticket, ticket.enqueued_at + 60) == 5
+
+
+def test_tick_rotates_past_unmatchable_tickets():
+    matches = FakeMatches()
+    mm = _matchmaker(matches, max_scans=2)
+    for i in range(4):
+        mm.enqueue(f"lonely{i}", "gato", "roblox", i * 20)
+    mm.enqueue("a", "gato", "roblox", 90)
+    mm.enqueue("b", "gato", "roblox", 90)
+
+    async def run():
+        for _ in range(3):
+            await mm.tick()
+
+    asyncio.run(run())
+    assert matches.pairs == [{"a", "b"}]
+
+
+def test_unpolled_tickets_expire():
+    matches = FakeMatches()
+    mm = _matchmaker(matches, queue_ttl=30)
+    stale = mm.enqueue("stale", "gato", "roblox", 10)
+    polled = mm.enqueue("polled", "gato", "roblox", 50)
+    stale.last_seen -= 60
+    polled.last_seen -= 60
+    mm.status("polled")
+
+    asyncio.run(mm.tick())
+
+    assert mm.status("stale") is None
+    assert stale.status == "expired"
+    assert mm.status("polled").status == "queued"
+    assert mm.snapshot()["expired"] == 1
+
+    # An expired ticket is gone from the buckets, so it can't be matched
+    mm.enqueue("late", "gato", "roblox", 10)
+    asyncio.run(mm.tick())
+    assert matches.pairs == []
+
+
+def test_stale_candidates_are_skipped_before_their_own_scan():
+    matches = FakeMatches()
+    mm = _matchmaker(matches, max_scans=1, queue_ttl=30)
+    mm.enqueue("a", "gato", "roblox", 10)
+    stale = mm.enqueue("stale", "gato", "roblox", 11)
+    mm.enqueue("b", "gato", "roblox", 12)
+    stale.last_seen -= 60
+
+    asyncio.run(mm.tick())
+
+    assert matches.pairs == [{"a", "b"}]
+    assert stale.status == "expired"
+    assert mm.snapshot() == {"queued": 0, "matches_made": 1, "expired": 1}
+
+
+def test_enqueue_while_matching_keeps_ticket():
+    matches = FakeMatches()
+
+    async def run():
+        matches.release = asyncio.Event()
+        mm = _matchmaker(matches)
+        first = mm.enqueue("a", "gato", "roblox", 10)
+        mm.enqueue("b", "gato", "roblox", 10)
+        tick = asyncio.ensure_future(mm.tick())
+        await asyncio.sleep(0)
+        assert first.status == "matching"
+        assert mm.enqueue("a", "jhon", "discord", 10) is first
+        matches.release.set()
+        await tick
+        return first
+
+    assert asyncio.run(run()).status == "matched"
+
+
+def test_failed_match_requeues_current_tickets_only():
+    matches = FakeMatches(fail=True)
+
+    async def run():
+        matches.release = asyncio.Event()
+        mm = _matchmaker(matches)
+        a = mm.enqueue("a", "gato", "roblox", 10)
+        b = mm.enqueue("b", "gato", "roblox", 10)
+        tick = asyncio.ensure_future(mm.tick())
+        await asyncio.sleep(0)
+        # b's ticket is dropped (e.g. expired result cleanup) while the match is created
+        del mm._tickets["b"]
+        matches.release.set()
+        await tick
+        return mm, a, b
+
+    mm, a, b = asyncio.run(run())
+    assert a.status == "queued"
+    assert b.status == "cancelled"
+    assert mm.snapshot()["queued"] == 1
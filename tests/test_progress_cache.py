@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+import server
+from store import Store
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+class RacingStore(Store):
+    """Store whose stats read lets a write to the player land mid-read."""
+
+    write_during_read = False
+
+    async def get_stats(self, player_id):
+        stats = await super().get_stats(player_id)
+        if self.write_during_read:
+            await self.db.players.update_one({"player_id": player_id}, {"$inc": {"coins": 100}})
+            server.invalidate_player_reads(player_id)
+        return stats
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = RacingStore(mongomock_motor.AsyncMongoMockClient()["test"])
+    monkeypatch.setattr(server, "store", store)
+    monkeypatch.setattr(server, "_achievement_progress_cache", server.OrderedDict())
+    asyncio.run(store.insert_player({"player_id": "p", "level": 1, "coins": 0}))
+    return store
+
+
+def _coins_progress():
+    progress = asyncio.run(server.get_achievement_progress("p"))
+    return next(p["current"] for p in progress if p["counter"] == "coins")
+
+
+def test_progress_read_racing_a_write_is_not_cached(store):
+    store.write_during_read = True
+    assert _coins_progress() == 0
+    assert "p" not in server._achievement_progress_cache
+
+    store.write_during_read = False
+    assert _coins_progress() == 100
+    assert "p" in server._achievement_progress_cache
+
+
+def test_evicted_generations_still_invalidate(monkeypatch):
+    monkeypatch.setattr(server, "ACHIEVEMENT_PROGRESS_CACHE_SIZE", 2)
+    monkeypatch.setattr(server, "_write_generations", server.OrderedDict())
+    monkeypatch.setattr(server, "_evicted_write_generation", 0)
+    before = server.player_write_generation("p")
+    for player_id in ("p", "a", "b", "c"):
+        server.invalidate_player_reads(player_id)
+
+    assert "p" not in server._write_generations
+    assert server.player_write_generation("p") != before
@@ -0,0 +1,94 @@
+import pytest
+
+from progression import (
+    DLC_UNLOCK_LEVEL,
+    LEVEL_XP,
+    MAX_LEVEL,
+    history_achievements,
+    level_progress,
+    session_result_achievements,
+    total_xp_of,
+    xp_grant_pipeline,
+)
+
+
+def test_level_xp_table():
+    assert LEVEL_XP[:4] == [0, 100, 300, 600]
+    assert len(LEVEL_XP) == MAX_LEVEL
+    # Leaving level L costs L * 100 XP
+    assert all(LEVEL_XP[i + 1] - LEVEL_XP[i] == (i + 1) * 100 for i in range(MAX_LEVEL - 1))
+
+
+@pytest.mark.parametrize("total_xp, level, xp", [
+    (0, 1, 0),
+    (99, 1, 99),
+    (100, 2, 0),
+    (299, 2, 199),
+    (300, 3, 0),
+    (-50, 1, 0),
+])
+def test_level_progress(total_xp, level, xp):
+    progress = level_progress(total_xp)
+    assert (progress["level"], progress["xp"]) == (level, xp)
+    assert progress["xp_for_next_level"] == level * 100
+
+
+def test_level_progress_caps_at_max_level():
+    progress = level_progress(LEVEL_XP[-1] + 12345)
+    assert progress["level"] == MAX_LEVEL
+    assert progress["xp"] == 12345
+    assert progress["xp_for_next_level"] == 0
+    assert progress["progress"] == 1.0
+
+
+def test_total_xp_of_legacy_player():
+    assert total_xp_of({"level": 3, "xp": 20}) == 320
+    assert total_xp_of({"level": 3, "xp": 20, "total_xp": 5}) == 5
+    assert total_xp_of({}) == 0
+
+
+@pytest.mark.parametrize("player, xp", [
+    ({"total_xp": 0}, 50),
+    ({"total_xp": 40}, 400),  # several levels at once
+    ({"total_xp": 90}, LEVEL_XP[DLC_UNLOCK_LEVEL]),
+    ({"total_xp": 500}, -450),
+    ({"total_xp": 500}, -1000),
+    ({"total_xp": LEVEL_XP[-1]}, 10 ** 6),
+    ({"level": 3, "xp": 20}, 400),  # legacy document without total_xp
+    ({"level": 1, "xp": 0, "unlocked_dlc": True}, 10),
+])
+def test_xp_grant_pipeline_matches_level_progress(player, xp):
+    mongomock = pytest.importorskip("mongomock")
+    players = mongomock.MongoClient().db.players
+    players.insert_one({"_id": "p", **player})
+
+    players.update_one({"_id": "p"}, xp_grant_pipeline(xp))
+
+    doc = players.find_one({"_id": "p"})
+    expected = level_progress(total_xp_of(player) + xp)
+    assert (doc["level"], doc["xp"], doc["total_xp"]) == (expected["level"], expected["xp"], expected["total_xp"])
+    assert doc["unlocked_dlc"] == (player.get("unlocked_dlc", False) or expected["level"] >= DLC_UNLOCK_LEVEL)
+
+
+@pytest.mark.parametrize("session, expected", [
+    ({"victory": False, "duration": 10, "character_id": "gato"}, []),
+    ({"victory": True, "duration": 60, "character_id": "gato"}, ["speed_demon", "gato_win"]),
+    ({"victory": True, "duration": 120, "health_remaining": 100, "max_health": 100}, ["perfect_game"]),
+    ({"victory": True, "duration": 120, "health_remaining": 5, "max_health": 100}, ["survivor"]),
+    ({"victory": True, "duration": 120, "health_remaining": 0, "max_health": 100}, []),
+    ({"victory": True, "duration": 120, "health_remaining": None, "max_health": None}, []),
+])
+def test_session_result_achievements(session, expected):
+    assert session_result_achievements(session) == expected
+
+
+def test_history_achievements_from_win_summaries():
+    stats = {"total_enemies_killed": 5, "characters_played": ["gato"], "maps_played": ["roblox"]}
+    wins = [
+        {"character_id": "gato", "speed": True, "perfect": False, "survivor": False},
+        {"character_id": "jhon", "speed": False, "perfect": True, "survivor": False},
+    ]
+    earned = history_achievements({"level": 1, "coins": 0}, stats, wins)
+    assert {"first_blood", "kill_5", "map_roblox", "speed_demon", "gato_win", "perfect_game", "jhon_win"} <= set(earned)
+    assert "survivor" not in earned
+    assert len(earned) == len(set(earned))
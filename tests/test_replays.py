@@ -0,0 +1,42 @@
+import pytest
+
+from replays import ReplayError, parse_content_range, parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=90-500", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=99-99", (99, 99)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=50-10", "bytes=-", "bytes=0-1,5-6", "items=0-1", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ReplayError) as e:
+        parse_range(header, 100)
+    assert e.value.status_code == 416
+    assert e.value.headers == {"Content-Range": "bytes */100"}
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, (0, None, None)),
+    ("bytes 0-99/200", (0, 99, 200)),
+    ("bytes 100-199/200", (100, 199, 200)),
+    (" bytes 5-5/6 ", (5, 5, 6)),
+])
+def test_parse_content_range(header, expected):
+    assert parse_content_range(header) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes 10-5/200", "bytes 0-200/200", "bytes 0-9/*", "bytes */200", "0-9/200"])
+def test_parse_content_range_invalid(header):
+    with pytest.raises(ReplayError) as e:
+        parse_content_range(header)
+    assert e.value.status_code == 400
@@ -0,0 +1,46 @@
+import pytest
+
+import response_encoding
+from response_encoding import _negotiate_encoding, _prefers_msgpack, _q_values
+
+
+def test_q_values():
+    assert _q_values("gzip, br;q=0.5, *;q=0") == {"gzip": 1.0, "br": 0.5, "*": 0.0}
+    assert _q_values(" GZip ; Q=0.8 ,, ") == {"gzip": 0.8}
+    assert _q_values("br;q=high") == {"br": 0.0}
+    assert _q_values("") == {}
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("*", "br"),
+    ("br;q=0, *;q=0.5", "gzip"),
+])
+def test_negotiate_encoding(header, expected):
+    assert _negotiate_encoding(header) == expected
+
+
+def test_negotiate_encoding_without_brotli(monkeypatch):
+    monkeypatch.setattr(response_encoding, "brotli", None)
+    assert _negotiate_encoding("br, gzip;q=0.1") == "gzip"
+    assert _negotiate_encoding("br") is None
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("", False),
+    ("application/json", False),
+    ("application/msgpack", True),
+    ("application/x-msgpack", True),
+    ("application/json, application/msgpack", True),
+    ("application/json, application/msgpack;q=0.5", False),
+    ("application/msgpack;q=0.5, */*;q=0.1", True),
+    ("application/msgpack;q=0.5, application/*", False),
+    ("application/msgpack;q=0", False),
+])
+def test_prefers_msgpack(header, expected):
+    assert _prefers_msgpack(header) is expected
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+import session_archive
+from session_archive import _write_partitions, archive_sessions, find_archived_session, read_archived_sessions
+
+
+@pytest.fixture(autouse=True)
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_archive, "ARCHIVE_DIR", tmp_path / "game_sessions")
+    monkeypatch.setattr(session_archive, "ARCHIVE_ROW_GROUP_SIZE", 2)
+    return tmp_path / "game_sessions"
+
+
+def _session(session_id, player_id, created_at, **fields):
+    return {
+        "session_id": session_id,
+        "player_id": player_id,
+        "character_id": "gato",
+        "map_id": "roblox",
+        "score": 10,
+        "victory": True,
+        "created_at": created_at,
+        **fields,
+    }
+
+
+def _read(player_id, skip=0, limit=100, exclude=()):
+    return asyncio.run(read_archived_sessions(player_id, skip, limit, exclude))
+
+
+def test_round_trip_newest_first_across_months():
+    _write_partitions([
+        _session("s1", "p", "2025-01-05T00:00:00+00:00", replay={"size": 10, "frames": 2}, match_id="m1"),
+        _session("s2", "p", "2025-02-05T00:00:00+00:00", health_remaining=5, max_health=100),
+        _session("o1", "other", "2025-01-06T00:00:00+00:00"),
+    ])
+    _write_partitions([_session("s3", "p", "2025-02-06T00:00:00+00:00")])
+
+    sessions = _read("p")
+
+    assert [s["session_id"] for s in sessions] == ["s3", "s2", "s1"]
+    assert sessions[2]["replay"] == {"size": 10, "frames": 2}
+    assert sessions[2]["match_id"] == "m1"
+    assert sessions[1]["health_remaining"] == 5
+    assert sessions[0]["health_remaining"] is None and sessions[0]["replay"] is None
+
+
+def test_paging_and_exclude():
+    _write_partitions([_session(f"s{i}", "p", f"2025-01-0{i}T00:00:00+00:00") for i in range(1, 7)])
+    # Re-archiving the same session after an interrupted run doesn't duplicate it
+    _write_partitions([_session("s6", "p", "2025-01-06T00:00:00+00:00")])
+
+    assert [s["session_id"] for s in _read("p", skip=1, limit=2)] == ["s5", "s4"]
+    assert [s["session_id"] for s in _read("p", skip=1, limit=2, exclude=["s6", "s5"])] == ["s3", "s2"]
+    assert len(_read("p")) == 6
+    assert _read("p", limit=0) == []
+    assert _read("nobody") == []
+
+
+def test_find_archived_session():
+    _write_partitions([
+        _session("s1", "p", "2025-01-05T00:00:00+00:00", replay={"size": 10, "frames": 2}),
+        _session("o1", "other", "2025-02-06T00:00:00+00:00"),
+    ])
+
+    assert asyncio.run(find_archived_session("s1"))["replay"] == {"size": 10, "frames": 2}
+    assert asyncio.run(find_archived_session("s1", "p"))["player_id"] == "p"
+    assert asyncio.run(find_archived_session("s1", "other")) is None
+    assert asyncio.run(find_archived_session("missing")) is None
+
+
+def test_unfinished_parts_are_ignored(archive_dir):
+    _write_partitions([_session("s1", "p", "2025-01-05T00:00:00+00:00")])
+    (archive_dir / "month=2025-01" / ".part-crashed.parquet.tmp").write_bytes(b"PAR1 truncated")
+
+    assert [s["session_id"] for s in _read("p")] == ["s1"]
+    assert all(not f.name.startswith(".") for f in archive_dir.glob("month=*/part-*"))
+
+
+def test_archive_sessions_moves_old_sessions_and_flags_players():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["test"]
+        await db.players.insert_many([{"_id": "p", "player_id": "p"}, {"_id": "q", "player_id": "q"}])
+        await db.game_sessions.insert_many([
+            _session("old", "p", "2020-01-01T00:00:00+00:00"),
+            _session("new", "q", "2999-01-01T00:00:00+00:00"),
+        ])
+        archived = await archive_sessions(db, max_age_days=30)
+        hot = [s["session_id"] async for s in db.game_sessions.find({})]
+        flags = {p["player_id"]: p.get("has_archived_sessions", False) async for p in db.players.find({})}
+        return archived, hot, flags
+
+    archived, hot, flags = asyncio.run(run())
+    assert archived == 1
+    assert hot == ["new"]
+    assert flags == {"p": True, "q": False}
+    assert [s["session_id"] for s in _read("p")] == ["old"]
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+class SlowQuery:
+    """Query stand-in counting calls; each call returns once ``release`` is set."""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        call = self.calls
+        await self.release.wait()
+        return {"call": call, "items": []}
+
+
+def test_concurrent_callers_share_one_query():
+    async def run():
+        flights, query = SingleFlight(), SlowQuery()
+        callers = [asyncio.ensure_future(flights.do("k", query)) for _ in range(3)]
+        other = asyncio.ensure_future(flights.do("other", query))
+        await asyncio.sleep(0)
+        query.release.set()
+        results = await asyncio.gather(*callers)
+        await other
+        # Nothing is cached once the call completes
+        after = await flights.do("k", query)
+        return flights, query, results, after
+
+    flights, query, results, after = asyncio.run(run())
+    assert query.calls == 3
+    assert flights.shared == 2
+    assert [r["call"] for r in results] == [1, 1, 1]
+    assert after["call"] == 3
+
+
+def test_callers_get_their_own_copy():
+    async def run():
+        flights, query = SingleFlight(), SlowQuery()
+        callers = [asyncio.ensure_future(flights.do("k", query)) for _ in range(2)]
+        await asyncio.sleep(0)
+        query.release.set()
+        return await asyncio.gather(*callers)
+
+    first, second = asyncio.run(run())
+    first["items"].append("mutated")
+    assert second["items"] == []
+
+
+def test_cancelled_caller_does_not_cancel_shared_query():
+    async def run():
+        flights, query = SingleFlight(), SlowQuery()
+        cancelled = asyncio.ensure_future(flights.do("k", query))
+        waiting = asyncio.ensure_future(flights.do("k", query))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        query.release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        return query, await waiting
+
+    query, result = asyncio.run(run())
+    assert query.calls == 1
+    assert result["call"] == 1
+
+
+def test_forget_starts_a_fresh_query():
+    async def run():
+        flights, query = SingleFlight(), SlowQuery()
+        before = asyncio.ensure_future(flights.do("k", query))
+        await asyncio.sleep(0)
+        flights.forget("k", "unknown")
+        after = asyncio.ensure_future(flights.do("k", query))
+        await asyncio.sleep(0)
+        query.release.set()
+        return await before, await after, flights
+
+    before, after, flights = asyncio.run(run())
+    assert (before["call"], after["call"]) == (1, 2)
+    assert flights.shared == 0
+
+
+def test_errors_reach_every_caller():
+    async def fail():
+        await asyncio.sleep(0)
+        raise ValueError("boom")
+
+    async def run():
+        flights = SingleFlight()
+        return await asyncio.gather(flights.do("k", fail), flights.do("k", fail), return_exceptions=True)
+
+    assert [type(r) for r in asyncio.run(run())] == [ValueError, ValueError]
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+from store import Store, UnmigratedKeyError
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+def _run(test):
+    """Run ``test(store)`` against a fresh in-memory database."""
+    return asyncio.run(test(Store(mongomock_motor.AsyncMongoMockClient()["test"])))
+
+
+def test_updates_by_compound_key():
+    async def test(store):
+        await store.insert_player({"player_id": "p", "coins": 10})
+        await store.update_player("p", {"$inc": {"coins": 5}})
+        await store.set_stats("p", {"total_purchases": 1})
+        await store.set_stats("p", {"total_purchases": 2})
+        return await store.get_player("p"), await store.db.player_stats.find({}).to_list(None)
+
+    player, stats = _run(test)
+    assert player["coins"] == 15
+    assert stats == [{"_id": "p", "player_id": "p", "total_purchases": 2}]
+
+
+def test_missing_documents_are_not_errors():
+    async def test(store):
+        assert await store.update_player("nobody", {"$set": {"coins": 1}}, return_document=True) is None
+        await store.update_session("nobody", "s", {"score": 1})
+        await store.set_stats("p", {"total_purchases": 1})
+        return await store.get_stats("p")
+
+    assert _run(test) == {"player_id": "p", "total_purchases": 1}
+
+
+@pytest.mark.parametrize("write", [
+    lambda store: store.update_player("p", {"$set": {"coins": 1}}),
+    lambda store: store.update_player("p", {"$set": {"coins": 1}}, return_document=True),
+    lambda store: store.set_stats("p", {"total_purchases": 1}),
+    lambda store: store.update_session("p", "s", {"score": 1}),
+    lambda store: store.add_challenge_progress("p", "2026-W43", {"wins": 1}),
+])
+def test_writes_to_legacy_documents_fail_loudly(write):
+    async def test(store):
+        for name, fields in [
+            ("players", {"coins": 0}),
+            ("player_stats", {"total_purchases": 0}),
+            ("game_sessions", {"session_id": "s"}),
+            ("player_challenges", {"week": "2026-W43"}),
+        ]:
+            await store.db[name].insert_one({"_id": ObjectId(), "player_id": "p", **fields})
+        with pytest.raises(UnmigratedKeyError):
+            await write(store)
+        return await store.db.player_stats.count_documents({})
+
+    # Nothing was upserted alongside the legacy document
+    assert _run(test) == 1
+
+
+def test_insert_achievements_returns_only_new_unlocks():
+    async def test(store):
+        first = await store.insert_achievements("p", ["kill_5", "first_win", "kill_5"])
+        second = await store.insert_achievements("p", ["first_win", "kill_10"])
+        unlocked = await store.list_achievements("p")
+        return first, second, unlocked, await store.insert_achievements("p", [])
+
+    first, second, unlocked, empty = _run(test)
+    assert sorted(first) == ["first_win", "kill_5"]
+    assert second == ["kill_10"]
+    assert sorted(a["achievement_id"] for a in unlocked) == ["first_win", "kill_10", "kill_5"]
+    assert empty == []